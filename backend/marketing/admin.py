@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Cliente, GrupoCliente, Campanha, Anexo, Email, Relatorio
+from .models import Cliente, GrupoCliente, Segmento, Campanha, Anexo, Email, Relatorio, Importacao, Disparo
 
 @admin.register(Cliente)
 class ClienteAdmin(admin.ModelAdmin):
@@ -13,12 +13,18 @@ class GrupoClienteAdmin(admin.ModelAdmin):
     search_fields = ('nome',)
     filter_horizontal = ('clientes',)
 
+@admin.register(Segmento)
+class SegmentoAdmin(admin.ModelAdmin):
+    list_display = ('nome', 'total_cache', 'data_cache', 'data_atualizacao')
+    search_fields = ('nome', 'descricao')
+    readonly_fields = ('versao', 'versao_cache', 'total_cache', 'data_cache')
+
 @admin.register(Campanha)
 class CampanhaAdmin(admin.ModelAdmin):
     list_display = ('titulo', 'status', 'criador', 'data_criacao', 'data_agendamento')
     search_fields = ('titulo', 'descricao')
     list_filter = ('status', 'data_criacao', 'data_agendamento')
-    filter_horizontal = ('grupos',)
+    filter_horizontal = ('grupos', 'segmentos')
 
 @admin.register(Anexo)
 class AnexoAdmin(admin.ModelAdmin):
@@ -37,3 +43,13 @@ class RelatorioAdmin(admin.ModelAdmin):
     list_display = ('campanha', 'total_envios', 'taxa_abertura', 'taxa_clique', 'taxa_resposta', 'data_geracao')
     search_fields = ('campanha__titulo',)
     list_filter = ('data_geracao',)
+
+@admin.register(Importacao)
+class ImportacaoAdmin(admin.ModelAdmin):
+    list_display = ('id', 'status', 'linhas_processadas', 'clientes_criados', 'clientes_atualizados', 'total_erros', 'data_criacao')
+    list_filter = ('status', 'data_criacao')
+
+@admin.register(Disparo)
+class DisparoAdmin(admin.ModelAdmin):
+    list_display = ('id', 'campanha', 'status', 'clientes_processados', 'emails_criados', 'data_criacao')
+    list_filter = ('status', 'data_criacao')
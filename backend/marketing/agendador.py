@@ -0,0 +1,209 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+from concurrent.futures import ProcessPoolExecutor
+import logging
+import multiprocessing
+import signal
+import threading
+import time
+
+from .disparos import reservar_disparo
+from .fila import consultas_disponiveis
+from .metricas import metricas
+from .models import Campanha, Disparo, Email
+from .processos import executar_campanha, inicializar
+
+logger = logging.getLogger(__name__)
+
+def proxima_execucao():
+    """Data da próxima campanha agendada, obtida pelo índice parcial das campanhas agendadas"""
+    return (
+        Campanha.objects.filter(status='agendada')
+        .order_by('data_agendamento')
+        .values_list('data_agendamento', flat=True)
+        .first()
+    )
+
+class Agendador:
+    """
+    Processo persistente que dorme até a próxima campanha agendada e envia as campanhas
+    em paralelo em um pool de processos. SIGTERM/SIGINT encerram após os lotes em andamento.
+    """
+
+    def __init__(self, processos=None, espera_maxima=None, intervalo_status=None, escrever=None):
+        self.processos = processos or getattr(settings, 'MARKETING_PROCESSOS_AGENDADOR', 2)
+        self.espera_maxima = espera_maxima or getattr(settings, 'MARKETING_ESPERA_MAXIMA_AGENDADOR', 60)
+        self.intervalo_status = intervalo_status or getattr(settings, 'MARKETING_INTERVALO_STATUS_AGENDADOR', 60)
+        self.escrever = escrever or logger.info
+
+        self._parar = threading.Event()
+        self._acordar = threading.Event()
+        self._parada = None
+        self._lock = threading.Lock()
+        self._em_execucao = {}
+
+        self._inicio = None
+        self._ultimo_status = None
+        self._enviados_ultimo_status = 0
+        self.total_enviados = 0
+        self.total_falhas = 0
+        self.campanhas_processadas = 0
+
+    def parar(self, *args):
+        """Para de iniciar campanhas e pede aos processos que não reservem novos lotes"""
+        if not self._parar.is_set():
+            self.escrever('Encerrando: aguardando os lotes em andamento...')
+        self._parar.set()
+        if self._parada is not None:
+            self._parada.set()
+        self._acordar.set()
+
+    def estado(self):
+        """Profundidade da fila e vazão atual do agendador"""
+        with self._lock:
+            em_execucao = len(self._em_execucao)
+            enviados = self.total_enviados
+            falhas = self.total_falhas
+        decorrido = time.monotonic() - self._inicio if self._inicio else 0
+        return {
+            'campanhas_em_execucao': em_execucao,
+            'campanhas_agendadas': Campanha.objects.filter(status='agendada').count(),
+            'disparos_pendentes': Disparo.objects.filter(status__in=['pendente', 'processando']).count(),
+            'emails_pendentes': Email.objects.filter(status__in=['aguardando', 'enviando']).count(),
+            'emails_enviados': enviados,
+            'emails_falhas': falhas,
+            'emails_por_segundo': round(enviados / decorrido, 2) if decorrido else 0.0,
+        }
+
+    def executar(self):
+        contexto = multiprocessing.get_context('spawn')
+        self._parada = contexto.Event()
+        self._inicio = self._ultimo_status = time.monotonic()
+
+        signal.signal(signal.SIGTERM, self.parar)
+        signal.signal(signal.SIGINT, self.parar)
+
+        self.escrever(f'Agendador iniciado com {self.processos} processos')
+        with ProcessPoolExecutor(max_workers=self.processos, mp_context=contexto,
+                                 initializer=inicializar, initargs=(self._parada,)) as executor:
+            while not self._parar.is_set():
+                try:
+                    self._iniciar_vencidas()
+                    self._iniciar_disparos(executor)
+                    self._retomar_em_andamento(executor)
+                    self._registrar_status()
+                except Exception as e:
+                    logger.error(f"Erro no ciclo do agendador: {str(e)}")
+                self._acordar.wait(self._tempo_de_espera())
+                self._acordar.clear()
+            # Campanhas que ainda não começaram não são iniciadas; as em andamento concluem os lotes reservados
+            executor.shutdown(wait=True, cancel_futures=True)
+        self._registrar_status(forcar=True)
+        if metricas.ativo:
+            self.escrever(metricas.resumo())
+        self.escrever('Agendador encerrado')
+
+    def _submeter(self, executor, campanha_id, disparo_id=None):
+        """Envia a campanha em um processo do pool; False se ela já estiver em execução"""
+        with self._lock:
+            if campanha_id in self._em_execucao:
+                return False
+            futuro = executor.submit(executar_campanha, campanha_id, disparo_id)
+            self._em_execucao[campanha_id] = futuro
+        futuro.add_done_callback(lambda f: self._concluida(campanha_id, f, disparo_id))
+        return True
+
+    def _concluida(self, campanha_id, futuro, disparo_id=None):
+        if futuro.cancelled():
+            # Cancelada no encerramento antes de começar: o disparo volta para a fila
+            with self._lock:
+                self._em_execucao.pop(campanha_id, None)
+            if disparo_id is not None:
+                Disparo.objects.filter(id=disparo_id, status='processando').update(status='pendente')
+            return
+        with self._lock:
+            self._em_execucao.pop(campanha_id, None)
+            try:
+                _, resultado, duracao, dados_metricas = futuro.result()
+            except Exception as e:
+                logger.error(f"Erro ao processar campanha {campanha_id}: {str(e)}")
+                resultado, duracao, dados_metricas = {'enviados': 0, 'falhas': 0, 'erro': str(e)}, 0, None
+            self.total_enviados += resultado.get('enviados', 0)
+            self.total_falhas += resultado.get('falhas', 0)
+            self.campanhas_processadas += 1
+        metricas.mesclar(dados_metricas)
+        self.escrever(
+            f"Campanha {campanha_id}: {resultado.get('enviados', 0)} enviados, "
+            f"{resultado.get('falhas', 0)} falhas em {duracao:.1f}s"
+        )
+        self._acordar.set()
+
+    def _iniciar_vencidas(self):
+        agora = timezone.now()
+        vencidas = Campanha.objects.filter(status='agendada', data_agendamento__lte=agora).values_list('id', flat=True)
+        for campanha_id in vencidas:
+            if self._parar.is_set():
+                return
+            # A transição atômica impede que outro agendador inicie a mesma campanha
+            with transaction.atomic():
+                iniciada = Campanha.objects.filter(id=campanha_id, status='agendada').update(
+                    status='enviando', data_inicio_envio=agora
+                )
+                if iniciada:
+                    Disparo.objects.create(campanha_id=campanha_id)
+
+    def _iniciar_disparos(self, executor):
+        # Disparos criados pela API ou pelas campanhas agendadas vencidas
+        while not self._parar.is_set():
+            disparo = reservar_disparo()
+            if disparo is None:
+                return
+            if not self._submeter(executor, disparo.campanha_id, disparo.id):
+                # Campanha já em execução: devolver o disparo para a próxima volta
+                Disparo.objects.filter(id=disparo.id).update(status='pendente')
+                return
+
+    def _retomar_em_andamento(self, executor):
+        # Campanhas em envio com emails disponíveis (novos ou com reserva vencida) e sem processo ativo
+        with self._lock:
+            ativas = list(self._em_execucao)
+        vencidos, aguardando = consultas_disponiveis(campanha=OuterRef('pk'))
+        campanhas = (
+            Campanha.objects.filter(status='enviando')
+            .exclude(id__in=ativas)
+            .filter(Exists(vencidos) | Exists(aguardando))
+            .values_list('id', flat=True)
+        )
+        for campanha_id in campanhas:
+            if self._parar.is_set():
+                return
+            self._submeter(executor, campanha_id)
+
+    def _tempo_de_espera(self):
+        proxima = proxima_execucao()
+        espera = self.espera_maxima
+        if proxima is not None:
+            espera = min(espera, max(0.0, (proxima - timezone.now()).total_seconds()))
+        # Acordar também a tempo de registrar o status periódico
+        restante_status = self.intervalo_status - (time.monotonic() - self._ultimo_status)
+        return max(0.0, min(espera, restante_status))
+
+    def _registrar_status(self, forcar=False):
+        agora = time.monotonic()
+        if not forcar and agora - self._ultimo_status < self.intervalo_status:
+            return
+        estado = self.estado()
+        intervalo = agora - self._ultimo_status
+        recentes = estado['emails_enviados'] - self._enviados_ultimo_status
+        self._ultimo_status = agora
+        self._enviados_ultimo_status = estado['emails_enviados']
+        self.escrever(
+            f"Fila: {estado['campanhas_em_execucao']} campanhas em execução, "
+            f"{estado['campanhas_agendadas']} agendadas, {estado['disparos_pendentes']} disparos, "
+            f"{estado['emails_pendentes']} emails pendentes | "
+            f"Vazão: {recentes / intervalo if intervalo else 0:.1f} msgs/s recente, "
+            f"{estado['emails_por_segundo']} msgs/s média, {estado['emails_enviados']} enviados, "
+            f"{estado['emails_falhas']} falhas"
+        )
@@ -0,0 +1,93 @@
+from django.conf import settings
+from collections import OrderedDict
+from email import encoders
+from email.mime.base import MIMEBase
+import logging
+import mimetypes
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+def criar_parte_mime(conteudo, nome, tipo=None):
+    """Cria a parte MIME do anexo já codificada em base64"""
+    tipo = tipo or mimetypes.guess_type(nome)[0] or 'application/octet-stream'
+    if '/' not in tipo:
+        tipo = 'application/octet-stream'
+    tipo_principal, subtipo = tipo.split('/', 1)
+
+    parte = MIMEBase(tipo_principal, subtipo)
+    parte.set_payload(conteudo)
+    encoders.encode_base64(parte)
+    parte.add_header('Content-Disposition', 'attachment', filename=nome)
+    return parte
+
+class CacheAnexos:
+    """
+    Cache LRU das partes MIME dos anexos, compartilhado entre as campanhas em envio.
+    Cada arquivo é lido e codificado uma única vez enquanto couber no limite de memória.
+    """
+
+    def __init__(self, limite_bytes=None):
+        self._limite_bytes = limite_bytes
+        self._entradas = OrderedDict()
+        self._tamanho = 0
+        self._lock = threading.Lock()
+
+    @property
+    def limite_bytes(self):
+        if self._limite_bytes is not None:
+            return self._limite_bytes
+        return getattr(settings, 'MARKETING_CACHE_ANEXOS_BYTES', 64 * 1024 * 1024)
+
+    @property
+    def tamanho(self):
+        return self._tamanho
+
+    def _chave(self, anexo):
+        # O nome do arquivo muda a cada novo upload, então invalida a entrada automaticamente
+        return (anexo.pk, anexo.arquivo.name)
+
+    def _carregar(self, anexo):
+        with anexo.arquivo.open('rb') as arquivo:
+            conteudo = arquivo.read()
+        nome = anexo.nome or os.path.basename(anexo.arquivo.name)
+        return criar_parte_mime(conteudo, nome, anexo.tipo)
+
+    def obter(self, anexo):
+        """Retorna a parte MIME pré-codificada do anexo"""
+        chave = self._chave(anexo)
+        with self._lock:
+            parte = self._entradas.get(chave)
+            if parte is not None:
+                self._entradas.move_to_end(chave)
+                return parte
+
+        parte = self._carregar(anexo)
+        tamanho = len(parte.get_payload())
+
+        with self._lock:
+            if tamanho > self.limite_bytes:
+                logger.warning(f"Anexo {anexo.pk} ({tamanho} bytes) excede o limite do cache e não será mantido")
+                return parte
+            if chave not in self._entradas:
+                self._entradas[chave] = parte
+                self._tamanho += tamanho
+            self._entradas.move_to_end(chave)
+
+            # Descartar os anexos usados há mais tempo até voltar ao limite
+            while self._tamanho > self.limite_bytes:
+                _, removida = self._entradas.popitem(last=False)
+                self._tamanho -= len(removida.get_payload())
+            return self._entradas.get(chave, parte)
+
+    def partes_da_campanha(self, campanha):
+        """Carrega os anexos da campanha com uma única consulta"""
+        return [self.obter(anexo) for anexo in campanha.anexos.all()]
+
+    def limpar(self):
+        with self._lock:
+            self._entradas.clear()
+            self._tamanho = 0
+
+cache_anexos = CacheAnexos()
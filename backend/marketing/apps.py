@@ -1,6 +1,23 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_save
 
 
 class MarketingConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'marketing'
+
+    def ready(self):
+        from .banco import aplicar_pragmas_sqlite
+        from .models import Cliente, GrupoCliente
+        from .segmentos import invalidar_segmentos
+
+        connection_created.connect(aplicar_pragmas_sqlite, dispatch_uid='marketing_pragmas_sqlite')
+
+        # Escritas em clientes e grupos invalidam os totais dos segmentos em cache.
+        # As gravações em massa (bulk_create/update) não disparam sinais e chamam invalidar_segmentos diretamente.
+        post_save.connect(invalidar_segmentos, sender=Cliente, dispatch_uid='marketing_segmentos_cliente_salvo')
+        post_delete.connect(invalidar_segmentos, sender=Cliente, dispatch_uid='marketing_segmentos_cliente_removido')
+        post_delete.connect(invalidar_segmentos, sender=GrupoCliente, dispatch_uid='marketing_segmentos_grupo_removido')
+        m2m_changed.connect(invalidar_segmentos, sender=GrupoCliente.clientes.through,
+                            dispatch_uid='marketing_segmentos_participacoes')
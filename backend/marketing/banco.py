@@ -0,0 +1,10 @@
+from django.conf import settings
+
+def aplicar_pragmas_sqlite(sender, connection, **kwargs):
+    """Aplica MARKETING_SQLITE_PRAGMAS a cada nova conexão SQLite (sinal connection_created)"""
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'MARKETING_SQLITE_PRAGMAS', {})
+    with connection.cursor() as cursor:
+        for nome, valor in pragmas.items():
+            cursor.execute(f"PRAGMA {nome} = {valor}")
@@ -0,0 +1,532 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.mail import EmailMultiAlternatives
+from django.core.mail.backends.locmem import EmailBackend as LocmemBackend
+from django.db import OperationalError, connection
+from django.db.models.functions import Mod
+from django.test import Client
+from django.test.utils import override_settings
+from django.utils import timezone
+from collections import Counter
+from contextlib import contextmanager
+import csv
+import django
+import io
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+from .dados_sinteticos import NOMES, SOBRENOMES, GeradorDados, gerar_dados
+from .envio import Despachante
+from .fila import GravadorResultados, identificador_worker, reservar_lote
+from .importacao import importar_clientes_csv
+from .links import assinar_token, registrar_links
+from .models import Campanha, Cliente, Email, Relatorio
+from .publico import materializar_emails, resolver_publico
+from .renderizacao import CampanhaCompilada
+from .rastreamento import buffer_rastreamento, gravar_evento
+from .tasks import processar_envio_campanha, substituir_campos_dinamicos
+
+@contextmanager
+def banco_temporario(arquivo=False):
+    """
+    Executa o benchmark em um banco de teste descartável, nunca no banco configurado.
+    Com `arquivo`, o SQLite de teste fica em disco em vez de em memória, como em produção.
+    """
+    nome_original = connection.settings_dict['NAME']
+    teste = connection.settings_dict.setdefault('TEST', {})
+    nome_teste_original = teste.get('NAME')
+    diretorio = None
+    if arquivo and connection.vendor == 'sqlite':
+        diretorio = tempfile.mkdtemp(prefix='benchmark-')
+        teste['NAME'] = os.path.join(diretorio, 'benchmark.sqlite3')
+
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(nome_original, verbosity=0)
+        teste['NAME'] = nome_teste_original
+        if diretorio:
+            shutil.rmtree(diretorio, ignore_errors=True)
+
+class BackendComLatencia(LocmemBackend):
+    """Backend em memória que simula o tempo de ida e volta de um servidor SMTP"""
+
+    def __init__(self, latencia=0.0, **kwargs):
+        super().__init__(**kwargs)
+        self.latencia = latencia
+
+    def send_messages(self, messages):
+        if self.latencia:
+            time.sleep(self.latencia * len(messages))
+        return super().send_messages(messages)
+
+def _mensagens_sinteticas(total):
+    for i in range(total):
+        mensagem = EmailMultiAlternatives(
+            subject=f"Benchmark {i}",
+            body="Olá, esta é uma mensagem de benchmark.",
+            from_email='benchmark@exemplo.com',
+            to=[f"cliente{i}@exemplo.com"]
+        )
+        mensagem.attach_alternative("<html><body>Olá, esta é uma mensagem de benchmark.</body></html>", "text/html")
+        yield i, mensagem
+
+def benchmark_envio(mensagens=1000, workers=(1, 2, 4, 8), latencia=0.01, backend=None, taxa=0):
+    """Mede mensagens/s do despachante conforme o número de workers aumenta"""
+    resultados = []
+    for n_workers in workers:
+        if backend:
+            despachante = Despachante(workers=n_workers, taxa=taxa, backend=backend)
+        else:
+            despachante = Despachante(
+                workers=n_workers, taxa=taxa,
+                backend='marketing.benchmarks.BackendComLatencia', latencia=latencia
+            )
+
+        inicio = time.perf_counter()
+        falhas = sum(1 for _, erro in despachante.enviar(_mensagens_sinteticas(mensagens)) if erro)
+        duracao = time.perf_counter() - inicio
+
+        resultados.append({
+            'workers': n_workers,
+            'mensagens': mensagens,
+            'falhas': falhas,
+            'segundos': round(duracao, 4),
+            'mensagens_por_segundo': round(mensagens / duracao, 1) if duracao else None,
+        })
+    return resultados
+
+@contextmanager
+def servidor_smtp_local():
+    """Inicia um aiosmtpd que descarta as mensagens em um processo separado; produz a porta"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        porta = sock.getsockname()[1]
+    processo = subprocess.Popen(
+        [sys.executable, '-m', 'aiosmtpd', '-n', '-l', f'127.0.0.1:{porta}', '-c', 'aiosmtpd.handlers.Sink'],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        limite = time.monotonic() + 10
+        while True:
+            try:
+                socket.create_connection(('127.0.0.1', porta), timeout=1).close()
+                break
+            except OSError:
+                if processo.poll() is not None or time.monotonic() > limite:
+                    raise RuntimeError('Não foi possível iniciar o aiosmtpd; verifique se o pacote está instalado')
+                time.sleep(0.1)
+        yield porta
+    finally:
+        processo.terminate()
+        processo.wait()
+
+def benchmark_envio_smtp(mensagens=2000, conexoes=(1, 4, 16, 64), um_nucleo=True):
+    """
+    Compara o despachante com threads e o assíncrono enviando para um aiosmtpd local.
+    Com `um_nucleo`, o processo do benchmark fica restrito a uma CPU (o servidor roda em outro processo).
+    """
+    from .envio_async import DespachanteAssincrono
+
+    afinidade = None
+    if um_nucleo and hasattr(os, 'sched_setaffinity'):
+        afinidade = os.sched_getaffinity(0)
+        os.sched_setaffinity(0, {min(afinidade)})
+
+    resultados = []
+    try:
+        with servidor_smtp_local() as porta:
+            for n_conexoes in conexoes:
+                despachantes = (
+                    ('threads', Despachante(
+                        workers=n_conexoes, taxa=0, backend='django.core.mail.backends.smtp.EmailBackend',
+                        host='127.0.0.1', port=porta, username='', password='', use_tls=False, use_ssl=False
+                    )),
+                    ('asyncio', DespachanteAssincrono(
+                        conexoes=n_conexoes, taxa=0, hostname='127.0.0.1', port=porta,
+                        username=None, password=None, use_tls=False, start_tls=False
+                    )),
+                )
+                for tipo, despachante in despachantes:
+                    inicio = time.perf_counter()
+                    falhas = sum(1 for _, erro in despachante.enviar(_mensagens_sinteticas(mensagens)) if erro)
+                    duracao = time.perf_counter() - inicio
+                    resultados.append({
+                        'despachante': tipo,
+                        'conexoes': n_conexoes,
+                        'mensagens': mensagens,
+                        'falhas': falhas,
+                        'segundos': round(duracao, 4),
+                        'mensagens_por_segundo': round(mensagens / duracao, 1) if duracao else None,
+                    })
+    finally:
+        if afinidade is not None:
+            os.sched_setaffinity(0, afinidade)
+    return resultados
+
+def _renderizar_legado(campanha, email_obj, cliente):
+    # Caminho anterior: substituições sobre o texto inteiro e nova busca por <html e </body>
+    assunto = substituir_campos_dinamicos(campanha.assunto, cliente)
+    corpo = substituir_campos_dinamicos(campanha.corpo, cliente)
+    pixel_rastreamento = f"<img src='{settings.BASE_URL}/api/emails/{email_obj.uuid}/rastreamento/' width='1' height='1' />"
+    if "<html" in corpo:
+        if "</body>" in corpo:
+            corpo_html = corpo.replace("</body>", f"{pixel_rastreamento}</body>")
+        else:
+            corpo_html = f"{corpo}{pixel_rastreamento}"
+    else:
+        corpo_html = f"<html><body>{corpo}{pixel_rastreamento}</body></html>"
+    return assunto, corpo, corpo_html
+
+def benchmark_renderizacao(destinatarios=10000, tamanho_corpo=50000):
+    """Compara a personalização por substituição de texto com o template compilado"""
+    paragrafo = "<p>Olá {{nome}} {{sobrenome}}, confira as ofertas enviadas para {{email}}.</p>"
+    recheio = "<p>" + "Conteúdo estático da campanha. " * 20 + "</p>"
+    blocos = []
+    while sum(len(b) for b in blocos) < tamanho_corpo:
+        blocos.extend([paragrafo, recheio])
+    campanha = Campanha(
+        assunto="Ofertas para {{nome}}",
+        corpo=f"<html><body>{''.join(blocos)}</body></html>"
+    )
+    pares = [
+        (Email(uuid=uuid.uuid4()), Cliente(nome=f"Nome{i}", sobrenome="Sobrenome", email=f"cliente{i}@exemplo.com"))
+        for i in range(destinatarios)
+    ]
+
+    inicio = time.perf_counter()
+    for email_obj, cliente in pares:
+        _renderizar_legado(campanha, email_obj, cliente)
+    duracao_legado = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    compilada = CampanhaCompilada(campanha)
+    for email_obj, cliente in pares:
+        compilada.renderizar(email_obj, cliente)
+    duracao_compilado = time.perf_counter() - inicio
+
+    return [
+        {
+            'metodo': metodo,
+            'destinatarios': destinatarios,
+            'tamanho_corpo': len(campanha.corpo),
+            'segundos': round(duracao, 4),
+            'renderizacoes_por_segundo': round(destinatarios / duracao, 1) if duracao else None,
+        }
+        for metodo, duracao in (('substituicao', duracao_legado), ('compilado', duracao_compilado))
+    ]
+
+def benchmark_rastreamento(requisicoes=2000, buffer=True):
+    """
+    Compara requisições/s do pixel pela action do EmailViewSet e pela view enxuta por uuid,
+    e dos redirecionamentos de clique assinados
+    """
+    with banco_temporario(), override_settings(MARKETING_RASTREAMENTO_BUFFER=buffer, ALLOWED_HOSTS=['*']):
+        criador = User.objects.create(username='benchmark')
+        campanha = Campanha.objects.create(
+            titulo='Benchmark', assunto='Benchmark', criador=criador,
+            corpo='<a href="https://exemplo.com/oferta">Benchmark</a>'
+        )
+        link_id = registrar_links(campanha)['https://exemplo.com/oferta']
+        clientes = Cliente.objects.bulk_create([
+            Cliente(nome=f"Nome{i}", sobrenome="Sobrenome", email=f"cliente{i}@exemplo.com")
+            for i in range(requisicoes)
+        ])
+        emails = Email.objects.bulk_create([
+            Email(campanha=campanha, cliente=cliente, status='enviado') for cliente in clientes
+        ])
+
+        rotas = (
+            ('viewset', lambda email: f"/api/emails/{email.pk}/rastreamento/"),
+            ('uuid', lambda email: f"/api/emails/{email.uuid}/rastreamento/"),
+            ('clique', lambda email: f"/api/l/{assinar_token(campanha.id, email.pk, link_id)}/"),
+        )
+        resultados = []
+        for rota, url in rotas:
+            Email.objects.update(status='enviado', data_abertura=None, data_clique=None)
+            client = Client()
+
+            inicio = time.perf_counter()
+            for email in emails:
+                client.get(url(email))
+            duracao = time.perf_counter() - inicio
+            buffer_rastreamento.descarregar()
+
+            resultados.append({
+                'rota': rota,
+                'buffer': buffer,
+                'requisicoes': requisicoes,
+                'segundos': round(duracao, 4),
+                'requisicoes_por_segundo': round(requisicoes / duracao, 1) if duracao else None,
+            })
+        return resultados
+
+def _medir_carga(configuracao, duracao, remetentes, rastreadores, emails):
+    criador = User.objects.create(username='benchmark')
+    envio = Campanha.objects.create(titulo='Envio', assunto='Envio', corpo='Envio', criador=criador, status='enviando')
+    rastreada = Campanha.objects.create(titulo='Pixel', assunto='Pixel', corpo='Pixel', criador=criador)
+    clientes = Cliente.objects.bulk_create([
+        Cliente(nome=f"Nome{i}", sobrenome="Sobrenome", email=f"cliente{i}@exemplo.com") for i in range(emails)
+    ])
+    Email.objects.bulk_create([Email(campanha=envio, cliente=cliente) for cliente in clientes])
+    abertos = Email.objects.bulk_create([Email(campanha=rastreada, cliente=cliente, status='enviado') for cliente in clientes])
+    # Cada thread abre a própria conexão, com as configurações em teste
+    connection.close()
+
+    parar = threading.Event()
+    contagem = Counter()
+    lock = threading.Lock()
+
+    def remetente():
+        worker = identificador_worker()
+        gravador = GravadorResultados(worker, tamanho_lote=100)
+        try:
+            while not parar.is_set():
+                try:
+                    lote = reservar_lote(envio, worker, tamanho=100)
+                    if not lote:
+                        # Público esgotado: recomeçar para manter a carga de escrita até o fim
+                        Email.objects.filter(campanha=envio).update(status='aguardando', reservado_por='')
+                        continue
+                    for email_obj in lote:
+                        gravador.registrar(email_obj)
+                    gravador.descarregar()
+                    with lock:
+                        contagem['enviados'] += len(lote)
+                except OperationalError:
+                    with lock:
+                        contagem['erros_envio'] += 1
+        finally:
+            connection.close()
+
+    def rastreador(inicio):
+        try:
+            indice = inicio
+            while not parar.is_set():
+                try:
+                    gravar_evento('aberto', abertos[indice % len(abertos)].uuid, timezone.now())
+                    with lock:
+                        contagem['gravacoes'] += 1
+                except OperationalError:
+                    # Ex.: "database is locked" após o timeout do SQLite
+                    with lock:
+                        contagem['erros_pixel'] += 1
+                indice += rastreadores
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=remetente) for _ in range(remetentes)]
+    threads += [threading.Thread(target=rastreador, args=(i,)) for i in range(rastreadores)]
+    inicio = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    parar.wait(duracao)
+    parar.set()
+    for thread in threads:
+        thread.join()
+    segundos = time.perf_counter() - inicio
+
+    return {
+        'configuracao': configuracao,
+        'segundos': round(segundos, 2),
+        'gravacoes_pixel': contagem['gravacoes'],
+        'gravacoes_por_segundo': round(contagem['gravacoes'] / segundos, 1),
+        'erros_pixel': contagem['erros_pixel'],
+        'envios_por_segundo': round(contagem['enviados'] / segundos, 1),
+        'erros_envio': contagem['erros_envio'],
+    }
+
+def benchmark_carga(duracao=10, remetentes=2, rastreadores=4, emails=5000):
+    """
+    Mede as gravações/s do pixel de rastreamento (sem buffer) com envios concorrentes reservando
+    e gravando emails. No SQLite compara o journal padrão com os PRAGMAs configurados (WAL);
+    nos demais bancos mede a configuração de DATABASE_URL.
+    """
+    if connection.vendor == 'sqlite':
+        configuracoes = [
+            ('sqlite (journal padrão)', {'journal_mode': 'DELETE', 'synchronous': 'FULL'}),
+            ('sqlite (MARKETING_SQLITE_PRAGMAS)', getattr(settings, 'MARKETING_SQLITE_PRAGMAS', {})),
+        ]
+    else:
+        configuracoes = [(connection.vendor, {})]
+
+    resultados = []
+    for nome, pragmas in configuracoes:
+        connection.close()
+        with override_settings(MARKETING_SQLITE_PRAGMAS=pragmas, MARKETING_RELATORIO_INCREMENTAL=False):
+            with banco_temporario(arquivo=True):
+                resultados.append(_medir_carga(nome, duracao, remetentes, rastreadores, emails))
+    return resultados
+
+def benchmark_publico(clientes=10000, grupos=20, grupos_por_cliente=2.0):
+    """Mede a resolução do público e a criação dos emails de campanhas com grupos sobrepostos"""
+    with banco_temporario(arquivo=True):
+        dados = gerar_dados(clientes=clientes, grupos=grupos, campanhas=3, grupos_por_cliente=grupos_por_cliente)
+        resultados = []
+        for campanha in Campanha.objects.filter(id__in=dados['ids_campanhas']).order_by('id'):
+            inicio = time.perf_counter()
+            publico = sum(1 for _ in resolver_publico(campanha).iterator(chunk_size=2000))
+            duracao_consulta = time.perf_counter() - inicio
+
+            inicio = time.perf_counter()
+            materializar_emails(campanha)
+            duracao = time.perf_counter() - inicio
+
+            resultados.append({
+                'campanha': 'todos_clientes' if campanha.todos_clientes else f'{campanha.grupos.count()} grupos',
+                'clientes': clientes,
+                'publico': publico,
+                'segundos_consulta': round(duracao_consulta, 4),
+                'segundos': round(duracao, 4),
+                'emails_por_segundo': round(publico / duracao, 1) if duracao else None,
+            })
+        return resultados
+
+def _csv_sintetico(linhas, semente=42):
+    gerador = GeradorDados(semente=semente)
+    saida = io.StringIO()
+    escritor = csv.writer(saida)
+    escritor.writerow(['Nome', 'Sobrenome', 'Email'])
+    for i in range(linhas):
+        nome, sobrenome = gerador.aleatorio.choice(NOMES), gerador.aleatorio.choice(SOBRENOMES)
+        escritor.writerow([nome, sobrenome, f"cliente{i}@{gerador.dominio()}"])
+    return saida.getvalue().encode('utf-8')
+
+def benchmark_importacao(linhas=10000):
+    """Mede importar_clientes_csv criando clientes novos e, com o mesmo arquivo, atualizando-os"""
+    conteudo = _csv_sintetico(linhas)
+    with banco_temporario(arquivo=True):
+        resultados = []
+        for operacao in ('criacao', 'atualizacao'):
+            arquivo = SimpleUploadedFile('clientes.csv', conteudo, content_type='text/csv')
+            inicio = time.perf_counter()
+            resultado = importar_clientes_csv(arquivo)
+            duracao = time.perf_counter() - inicio
+            resultados.append({
+                'operacao': operacao,
+                'linhas': linhas,
+                'criados': resultado['clientes_criados'],
+                'atualizados': resultado['clientes_atualizados'],
+                'erros': len(resultado['erros']),
+                'segundos': round(duracao, 4),
+                'linhas_por_segundo': round(linhas / duracao, 1) if duracao else None,
+            })
+        return resultados
+
+def benchmark_envio_campanha(clientes=10000):
+    """Mede o laço completo de envio (reserva, renderização, despacho e gravação) com o backend locmem"""
+    configuracoes = {
+        'EMAIL_BACKEND': 'django.core.mail.backends.locmem.EmailBackend',
+        'MARKETING_TAXA_ENVIO_POR_HOST': 0,
+        'MARKETING_BACKEND_ENVIO': 'threads',
+    }
+    with banco_temporario(arquivo=True), override_settings(**configuracoes):
+        dados = gerar_dados(clientes=clientes, grupos=0, campanhas=1)
+        campanha = Campanha.objects.get(id=dados['ids_campanhas'][0])
+        Relatorio.obter_para(campanha)
+        materializar_emails(campanha)
+        Campanha.objects.filter(id=campanha.id).update(status='enviando')
+        campanha.refresh_from_db()
+        mail.outbox = []
+
+        inicio = time.perf_counter()
+        resultado = processar_envio_campanha(campanha)
+        duracao = time.perf_counter() - inicio
+        mail.outbox = []
+
+        return [{
+            'clientes': clientes,
+            'enviados': resultado['enviados'],
+            'falhas': resultado['falhas'],
+            'segundos': round(duracao, 4),
+            'mensagens_por_segundo': round(resultado['enviados'] / duracao, 1) if duracao else None,
+        }]
+
+def benchmark_metricas(emails=10000, repeticoes=20):
+    """Mede atualizar_metricas (recontagem completa) sobre uma campanha com status variados"""
+    with banco_temporario(arquivo=True), override_settings(MARKETING_RELATORIO_INCREMENTAL=False):
+        dados = gerar_dados(clientes=emails, grupos=0, campanhas=1)
+        campanha = Campanha.objects.get(id=dados['ids_campanhas'][0])
+        materializar_emails(campanha)
+        # Distribuição típica após o envio, fixa pelo id: a maioria enviada, 25% abertos, 5% cliques e 2% falhas
+        campanha.emails.update(status='enviado')
+        for status_email, divisor, resto in (('aberto', 4, 1), ('clicado', 20, 2), ('falha', 50, 3)):
+            campanha.emails.alias(resto=Mod('id', divisor)).filter(resto=resto).update(status=status_email)
+        relatorio = Relatorio.obter_para(campanha)
+
+        inicio = time.perf_counter()
+        for _ in range(repeticoes):
+            relatorio.atualizar_metricas()
+        duracao = time.perf_counter() - inicio
+
+        return [{
+            'emails': emails,
+            'repeticoes': repeticoes,
+            'segundos': round(duracao, 4),
+            'milissegundos_por_atualizacao': round(duracao / repeticoes * 1000, 2),
+            'emails_por_segundo': round(emails * repeticoes / duracao, 1) if duracao else None,
+        }]
+
+def executar_suite(clientes=10000, requisicoes=2000):
+    """Executa os cenários que usam só o banco e o backend em memória; retorna os resultados por cenário"""
+    return {
+        'publico': benchmark_publico(clientes=clientes),
+        'importacao': benchmark_importacao(linhas=clientes),
+        'envio_campanha': benchmark_envio_campanha(clientes=clientes),
+        'metricas': benchmark_metricas(emails=clientes),
+        'rastreamento': benchmark_rastreamento(requisicoes=requisicoes),
+    }
+
+def _commit_atual():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=settings.BASE_DIR
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def salvar_resultados(caminho, resultados, parametros=None):
+    """Grava os resultados em JSON com o commit e o ambiente, para comparação entre versões"""
+    documento = {
+        'commit': _commit_atual(),
+        'data': timezone.now().isoformat(),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'banco': connection.vendor,
+        'parametros': parametros or {},
+        'resultados': resultados,
+    }
+    with open(caminho, 'w', encoding='utf-8') as arquivo:
+        json.dump(documento, arquivo, indent=2, ensure_ascii=False)
+    return documento
+
+def comparar_resultados(anterior, atual):
+    """
+    Compara as medidas de vazão (campos *_por_segundo) de dois documentos de salvar_resultados.
+    As linhas de cada cenário são pareadas pela posição; retorna (cenário, descrição, antes, depois, variação %).
+    """
+    comparacoes = []
+    for cenario, linhas in atual['resultados'].items():
+        for antes, depois in zip(anterior['resultados'].get(cenario, []), linhas):
+            descricao = ', '.join(
+                f'{chave}={valor}' for chave, valor in depois.items() if isinstance(valor, str)
+            )
+            for chave, valor in depois.items():
+                if not chave.endswith('_por_segundo') or not antes.get(chave) or valor is None:
+                    continue
+                variacao = (valor - antes[chave]) / antes[chave] * 100
+                comparacoes.append((cenario, f'{descricao} {chave}'.strip(), antes[chave], valor, round(variacao, 1)))
+    return comparacoes
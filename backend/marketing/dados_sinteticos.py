@@ -0,0 +1,152 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.utils import timezone
+from datetime import timedelta
+import random
+import unicodedata
+
+from .models import Campanha, Cliente, GrupoCliente
+from .segmentos import invalidar_segmentos
+
+NOMES = [
+    'Ana', 'Bruno', 'Carla', 'Daniel', 'Eduarda', 'Felipe', 'Gabriela', 'Henrique', 'Isabela', 'João',
+    'Juliana', 'Lucas', 'Mariana', 'Mateus', 'Natália', 'Pedro', 'Rafaela', 'Rodrigo', 'Sofia', 'Thiago',
+]
+SOBRENOMES = [
+    'Silva', 'Santos', 'Oliveira', 'Souza', 'Rodrigues', 'Ferreira', 'Alves', 'Pereira', 'Lima', 'Gomes',
+    'Costa', 'Ribeiro', 'Martins', 'Carvalho', 'Almeida', 'Lopes', 'Soares', 'Fernandes', 'Vieira', 'Barbosa',
+]
+# Participação aproximada dos provedores em uma base brasileira; o restante vai para domínios corporativos
+DOMINIOS = [
+    ('gmail.com', 0.45), ('hotmail.com', 0.15), ('outlook.com', 0.07), ('yahoo.com.br', 0.06),
+    ('uol.com.br', 0.03), ('bol.com.br', 0.03), ('icloud.com', 0.02), ('terra.com.br', 0.02),
+]
+DOMINIOS_CORPORATIVOS = 500
+
+def _sem_acentos(texto):
+    return unicodedata.normalize('NFKD', texto).encode('ascii', 'ignore').decode().lower()
+
+class GeradorDados:
+    """
+    Gera clientes, grupos e campanhas sintéticos de forma reprodutível: a mesma `semente`
+    produz os mesmos dados. Os clientes são gravados em lotes, sem manter a base em memória.
+
+    Cada cliente entra em `grupos_por_cliente` grupos em média, escolhidos com pesos decrescentes
+    (o primeiro grupo é o maior), de modo que os grupos se sobrepõem como em uma base real.
+    """
+
+    def __init__(self, semente=42, tamanho_lote=None, dias_cadastro=730, fracao_inativos=0.05):
+        self.aleatorio = random.Random(semente)
+        self.tamanho_lote = tamanho_lote or getattr(settings, 'MARKETING_TAMANHO_LOTE', 1000)
+        self.dias_cadastro = dias_cadastro
+        self.fracao_inativos = fracao_inativos
+        corporativa = 1 - sum(peso for _, peso in DOMINIOS)
+        self._dominios = [dominio for dominio, _ in DOMINIOS] + [None]
+        self._pesos_dominios = [peso for _, peso in DOMINIOS] + [corporativa]
+
+    def dominio(self):
+        dominio = self.aleatorio.choices(self._dominios, self._pesos_dominios)[0]
+        if dominio is None:
+            dominio = f"empresa{self.aleatorio.randrange(DOMINIOS_CORPORATIVOS)}.com.br"
+        return dominio
+
+    def _grupos_do_cliente(self, grupos, pesos, media):
+        quantidade = int(media) + (1 if self.aleatorio.random() < media - int(media) else 0)
+        quantidade = min(quantidade, len(grupos))
+        escolhidos = set()
+        while len(escolhidos) < quantidade:
+            escolhidos.add(self.aleatorio.choices(grupos, pesos)[0])
+        return escolhidos
+
+    def criar_grupos(self, quantidade):
+        return [
+            GrupoCliente.objects.create(nome=f"Grupo sintético {i + 1}", descricao='Gerado por gerar_dados')
+            for i in range(quantidade)
+        ]
+
+    def criar_clientes(self, quantidade, grupos=(), grupos_por_cliente=2.0, progresso=None):
+        """Cria `quantidade` clientes e suas participações nos grupos; retorna as participações criadas"""
+        ids_grupos = [grupo.id for grupo in grupos]
+        pesos = [1 / (i + 1) for i in range(len(ids_grupos))]
+        Participacao = GrupoCliente.clientes.through
+        # Continuar a numeração para que execuções sucessivas não gerem emails repetidos
+        inicio = Cliente.objects.count()
+        agora = timezone.now()
+        participacoes = 0
+
+        for deslocamento in range(0, quantidade, self.tamanho_lote):
+            numeros = range(inicio + deslocamento, inicio + min(quantidade, deslocamento + self.tamanho_lote))
+            lote = []
+            for numero in numeros:
+                nome = self.aleatorio.choice(NOMES)
+                sobrenome = self.aleatorio.choice(SOBRENOMES)
+                lote.append(Cliente(
+                    nome=nome,
+                    sobrenome=sobrenome,
+                    email=f"{_sem_acentos(nome)}.{_sem_acentos(sobrenome)}{numero}@{self.dominio()}",
+                    ativo=self.aleatorio.random() >= self.fracao_inativos,
+                ))
+
+            with transaction.atomic():
+                criados = Cliente.objects.bulk_create(lote)
+                if not connection.features.can_return_rows_from_bulk_insert:
+                    criados = list(Cliente.objects.filter(email__in=[cliente.email for cliente in lote]))
+                ids = [cliente.id for cliente in criados]
+
+                # data_cadastro é auto_now_add: espalhar os lotes pelo período, dos mais antigos aos mais novos
+                fracao = 1 - (deslocamento + len(lote)) / quantidade
+                Cliente.objects.filter(id__in=ids).update(
+                    data_cadastro=agora - timedelta(days=self.dias_cadastro * fracao)
+                )
+
+                if ids_grupos:
+                    novas = [
+                        Participacao(grupocliente_id=grupo_id, cliente_id=cliente_id)
+                        for cliente_id in ids
+                        for grupo_id in self._grupos_do_cliente(ids_grupos, pesos, grupos_por_cliente)
+                    ]
+                    Participacao.objects.bulk_create(novas, batch_size=self.tamanho_lote, ignore_conflicts=True)
+                    participacoes += len(novas)
+
+            if progresso:
+                progresso(deslocamento + len(lote), quantidade)
+        invalidar_segmentos()
+        return participacoes
+
+    def criar_campanhas(self, quantidade, grupos=(), criador=None):
+        """Cria campanhas em rascunho: a primeira para todos os clientes, as demais para 1 a 3 grupos"""
+        criador = criador or User.objects.get_or_create(username='dados_sinteticos')[0]
+        campanhas = []
+        for i in range(quantidade):
+            campanha = Campanha.objects.create(
+                titulo=f"Campanha sintética {i + 1}",
+                assunto=f"Ofertas da semana {i + 1} para {{{{nome}}}}",
+                corpo=(
+                    f"<html><body><p>Olá {{{{nome}}}} {{{{sobrenome}}}},</p>"
+                    f"<p>Confira as ofertas selecionadas para {{{{email}}}}.</p>"
+                    f"<p><a href=\"https://exemplo.com.br/ofertas/{i + 1}\">Ver ofertas</a> | "
+                    f"<a href=\"https://exemplo.com.br/descadastro\">Descadastrar</a></p></body></html>"
+                ),
+                criador=criador,
+                todos_clientes=i == 0 or not grupos,
+            )
+            if not campanha.todos_clientes:
+                campanha.grupos.set(self.aleatorio.sample(list(grupos), min(len(grupos), self.aleatorio.randint(1, 3))))
+            campanhas.append(campanha)
+        return campanhas
+
+def gerar_dados(clientes=10000, grupos=20, campanhas=5, grupos_por_cliente=2.0, semente=42,
+                tamanho_lote=None, progresso=None):
+    """Gera uma base sintética completa; retorna os totais criados"""
+    gerador = GeradorDados(semente=semente, tamanho_lote=tamanho_lote)
+    novos_grupos = gerador.criar_grupos(grupos)
+    participacoes = gerador.criar_clientes(clientes, novos_grupos, grupos_por_cliente, progresso=progresso)
+    novas_campanhas = gerador.criar_campanhas(campanhas, novos_grupos)
+    return {
+        'clientes': clientes,
+        'grupos': len(novos_grupos),
+        'participacoes': participacoes,
+        'campanhas': len(novas_campanhas),
+        'ids_campanhas': [campanha.id for campanha in novas_campanhas],
+    }
@@ -0,0 +1,56 @@
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from datetime import timedelta
+import logging
+
+from .models import Campanha, Disparo, Relatorio
+from .publico import materializar_emails
+
+logger = logging.getLogger(__name__)
+
+def reservar_disparo():
+    """Reserva atomicamente o próximo disparo pendente (ou abandonado); None se não houver"""
+    limite_abandono = timezone.now() - timedelta(seconds=getattr(settings, 'MARKETING_DISPARO_TIMEOUT', 600))
+    candidatos = Disparo.objects.filter(
+        Q(status='pendente') | Q(status='processando', data_atualizacao__lt=limite_abandono)
+    ).order_by('data_criacao').values_list('id', 'status')
+
+    for disparo_id, status_atual in candidatos[:10]:
+        # O filtro por status garante que dois workers não reservem o mesmo disparo
+        reservado = Disparo.objects.filter(id=disparo_id, status=status_atual).update(
+            status='processando',
+            data_inicio=timezone.now(),
+            data_atualizacao=timezone.now()
+        )
+        if reservado:
+            return Disparo.objects.select_related('campanha').get(id=disparo_id)
+    return None
+
+def processar_disparo(disparo, deve_parar=None):
+    """
+    Cria o relatório e os emails do público da campanha, registrando o progresso a cada lote.
+    Interrompido por `deve_parar()`, o disparo volta a 'pendente' e é retomado pelo próximo agendador.
+    """
+    def progresso(clientes_processados, emails_criados):
+        Disparo.objects.filter(id=disparo.id).update(
+            clientes_processados=clientes_processados,
+            emails_criados=emails_criados,
+            data_atualizacao=timezone.now()
+        )
+
+    try:
+        Relatorio.obter_para(disparo.campanha)
+        materializar_emails(disparo.campanha, progresso=progresso, deve_parar=deve_parar)
+        if deve_parar and deve_parar():
+            # Os emails já criados são ignorados na retomada
+            Disparo.objects.filter(id=disparo.id).update(status='pendente', data_atualizacao=timezone.now())
+        else:
+            Disparo.objects.filter(id=disparo.id).update(status='concluido', data_fim=timezone.now())
+    except Exception as e:
+        logger.error(f"Erro no disparo {disparo.id} da campanha {disparo.campanha_id}: {str(e)}")
+        Disparo.objects.filter(id=disparo.id).update(status='falha', erro=str(e), data_fim=timezone.now())
+        Campanha.objects.filter(id=disparo.campanha_id, status='enviando').update(status='falha')
+
+    disparo.refresh_from_db()
+    return disparo
@@ -0,0 +1,332 @@
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.mail import get_connection
+from django.utils import timezone
+from collections import OrderedDict, defaultdict, deque
+from contextlib import contextmanager
+from datetime import timedelta
+import logging
+import queue
+import threading
+import time
+
+from .metricas import metricas
+from .retentativas import dominio_email
+
+logger = logging.getLogger(__name__)
+
+class LimitadorTaxa:
+    """Token bucket: libera no máximo `taxa` mensagens por segundo, com rajadas até `capacidade`"""
+
+    def __init__(self, taxa, capacidade=None):
+        self.taxa = float(taxa)
+        self.capacidade = float(capacidade or max(1.0, self.taxa))
+        self._tokens = self.capacidade
+        self._ultimo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reabastecer(self, agora):
+        self._tokens = min(self.capacidade, self._tokens + (agora - self._ultimo) * self.taxa)
+        self._ultimo = agora
+
+    def tentar_consumir(self, quantidade=1):
+        """Consome os tokens se disponíveis; caso contrário retorna quanto tempo falta para tê-los"""
+        with self._lock:
+            self._reabastecer(time.monotonic())
+            if self._tokens >= quantidade:
+                self._tokens -= quantidade
+                return 0.0
+            return (quantidade - self._tokens) / self.taxa
+
+    def aguardar(self, quantidade=1):
+        """Bloqueia até que `quantidade` tokens estejam disponíveis"""
+        if self.taxa <= 0:
+            return
+        while True:
+            espera = self.tentar_consumir(quantidade)
+            if espera <= 0:
+                return
+            time.sleep(espera)
+
+_limitadores = {}
+_limitadores_lock = threading.Lock()
+
+def obter_limitador(chave, taxa):
+    """Retorna o limitador compartilhado por todos os despachantes para a mesma chave (host SMTP)"""
+    with _limitadores_lock:
+        limitador = _limitadores.get(chave)
+        if limitador is None or limitador.taxa != float(taxa):
+            limitador = LimitadorTaxa(taxa)
+            _limitadores[chave] = limitador
+        return limitador
+
+class PoolConexoes:
+    """Mantém conexões de email abertas e reutilizáveis entre os lotes de envio"""
+
+    def __init__(self, tamanho, backend=None, **kwargs):
+        self.tamanho = tamanho
+        self.backend = backend
+        self.kwargs = kwargs
+        self._livres = queue.LifoQueue()
+        self._todas = []
+        self._lock = threading.Lock()
+
+    def _nova_conexao(self):
+        conexao = get_connection(self.backend, fail_silently=False, **self.kwargs)
+        with self._lock:
+            self._todas.append(conexao)
+        return conexao
+
+    @contextmanager
+    def conexao(self):
+        try:
+            conexao = self._livres.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                criar = len(self._todas) < self.tamanho
+            conexao = self._nova_conexao() if criar else self._livres.get()
+        try:
+            yield conexao
+        finally:
+            self._livres.put(conexao)
+
+    def fechar(self):
+        with self._lock:
+            conexoes, self._todas = self._todas, []
+        for conexao in conexoes:
+            try:
+                conexao.close()
+            except Exception as e:
+                logger.warning(f"Erro ao fechar conexão de email: {str(e)}")
+        self._livres = queue.LifoQueue()
+
+def chave_host(conexao):
+    """Identifica o servidor de destino de uma conexão para fins de limitação de taxa"""
+    host = getattr(conexao, 'host', None)
+    if host:
+        return f"{host}:{getattr(conexao, 'port', '')}"
+    return f"{type(conexao).__module__}.{type(conexao).__name__}"
+
+class EnvioAdiado(Exception):
+    """Resultado de uma mensagem não enviada porque o domínio de destino já tem mensagens demais na fila"""
+
+    def __init__(self, dominio, ate):
+        super().__init__(f"Envios para {dominio} adiados até {ate:%H:%M:%S}")
+        self.dominio = dominio
+        self.ate = ate
+
+def limites_dominio(dominio):
+    """Taxa (mensagens/s) e concorrência configuradas para o domínio; 0 significa sem limite"""
+    limites = getattr(settings, 'MARKETING_LIMITES_DOMINIO', {})
+    return {'taxa': 0, 'concorrencia': 0, **limites.get('*', {}), **limites.get(dominio, {})}
+
+class FilaDominios:
+    """
+    Mensagens pendentes separadas pelo domínio do destinatário. As mensagens saem alternando
+    entre os domínios e respeitando a taxa e a concorrência de cada um, para que um provedor
+    limitado não segure os demais nem seja sobrecarregado.
+
+    Domínios com taxa limitada aceitam até `capacidade_dominio` mensagens na fila; as seguintes
+    são recusadas com EnvioAdiado, para voltarem ao banco em vez de ocupar a memória do envio.
+    """
+
+    def __init__(self, capacidade_dominio=None):
+        self.capacidade_dominio = capacidade_dominio or getattr(settings, 'MARKETING_LOTE_ENVIO', 50)
+        self.condicao = threading.Condition()
+        self._filas = OrderedDict()
+        self._em_andamento = defaultdict(int)
+        self._limites = {}
+        self._tamanho = 0
+        self._fechada = False
+
+    def __len__(self):
+        return self._tamanho
+
+    @property
+    def fechada(self):
+        return self._fechada
+
+    def _limites_de(self, dominio):
+        if dominio not in self._limites:
+            limites = limites_dominio(dominio)
+            # O limitador é compartilhado com as outras campanhas do mesmo processo
+            limitador = obter_limitador(f"dominio:{dominio}", limites['taxa']) if limites['taxa'] else None
+            self._limites[dominio] = (limites['concorrencia'], limitador)
+        return self._limites[dominio]
+
+    def colocar(self, item, dominio):
+        """Enfileira a mensagem; retorna um EnvioAdiado se o domínio já estiver saturado"""
+        with self.condicao:
+            _, limitador = self._limites_de(dominio)
+            fila = self._filas.get(dominio)
+            if limitador and fila and len(fila) >= self.capacidade_dominio:
+                return EnvioAdiado(dominio, timezone.now() + timedelta(seconds=len(fila) / limitador.taxa))
+            if fila is None:
+                fila = self._filas[dominio] = deque()
+            fila.append(item)
+            self._tamanho += 1
+            self.condicao.notify()
+            return None
+
+    def tentar_obter(self):
+        """
+        Retorna ((domínio, item), None) se alguma mensagem pode sair agora; caso contrário
+        (None, segundos até a próxima liberação por taxa), com None se não houver previsão.
+        """
+        with self.condicao:
+            espera = None
+            escolhido = None
+            for dominio in self._filas:
+                concorrencia, limitador = self._limites_de(dominio)
+                if concorrencia and self._em_andamento[dominio] >= concorrencia:
+                    continue
+                if limitador:
+                    falta = limitador.tentar_consumir()
+                    if falta > 0:
+                        espera = falta if espera is None else min(espera, falta)
+                        continue
+                escolhido = dominio
+                break
+            if escolhido is None:
+                return None, espera
+
+            fila = self._filas[escolhido]
+            item = fila.popleft()
+            self._tamanho -= 1
+            self._em_andamento[escolhido] += 1
+            # O domínio atendido vai para o fim, intercalando os domínios
+            if fila:
+                self._filas.move_to_end(escolhido)
+            else:
+                del self._filas[escolhido]
+            return (escolhido, item), None
+
+    def obter(self):
+        """Bloqueia até uma mensagem poder sair; retorna None quando a fila estiver fechada e vazia"""
+        with self.condicao:
+            while True:
+                obtido, espera = self.tentar_obter()
+                if obtido is not None:
+                    return obtido
+                if self._fechada and not self._tamanho:
+                    return None
+                self.condicao.wait(espera)
+
+    def concluir(self, dominio):
+        """Libera a vaga de concorrência ocupada por uma mensagem do domínio"""
+        with self.condicao:
+            self._em_andamento[dominio] -= 1
+            self.condicao.notify_all()
+
+    def fechar(self, descartar=False):
+        with self.condicao:
+            self._fechada = True
+            if descartar:
+                self._filas.clear()
+                self._tamanho = 0
+            self.condicao.notify_all()
+
+def dominio_mensagem(mensagem):
+    destinatarios = mensagem.recipients()
+    return dominio_email(destinatarios[0]) if destinatarios else ''
+
+class Despachante:
+    """Envia mensagens em paralelo usando conexões persistentes, intercalando os domínios de destino"""
+
+    def __init__(self, workers=None, tamanho_lote=None, taxa=None, backend=None, **kwargs):
+        self.workers = workers or getattr(settings, 'MARKETING_WORKERS_ENVIO', 4)
+        self.tamanho_lote = tamanho_lote or getattr(settings, 'MARKETING_LOTE_ENVIO', 50)
+        self.taxa = getattr(settings, 'MARKETING_TAXA_ENVIO_POR_HOST', 10) if taxa is None else taxa
+        self.pool = PoolConexoes(self.workers, backend=backend, **kwargs)
+
+    def _trabalhar(self, fila, resultados):
+        try:
+            self._enviar_da_fila(fila, resultados)
+        except Exception as e:
+            # Sem conexão (ex.: backend inválido): devolver o erro para as mensagens restantes
+            logger.error(f"Erro no worker de envio: {str(e)}")
+            obtido = fila.obter()
+            while obtido is not None:
+                dominio, (chave, _) = obtido
+                resultados.put((chave, e))
+                fila.concluir(dominio)
+                obtido = fila.obter()
+
+    def _enviar_da_fila(self, fila, resultados):
+        """Envia as mensagens liberadas pela fila usando uma conexão do pool"""
+        with self.pool.conexao() as conexao:
+            limitador = obter_limitador(chave_host(conexao), self.taxa) if self.taxa else None
+            while True:
+                obtido = fila.obter()
+                if obtido is None:
+                    return
+                dominio, (chave, mensagem) = obtido
+                try:
+                    if limitador:
+                        limitador.aguardar()
+                    with metricas.medir('smtp'):
+                        conexao.open()
+                        conexao.send_messages([mensagem])
+                    resultados.put((chave, None))
+                except Exception as e:
+                    resultados.put((chave, e))
+                    # A conexão pode ter ficado em estado inválido; a próxima mensagem reabre
+                    try:
+                        conexao.close()
+                    except Exception:
+                        pass
+                finally:
+                    fila.concluir(dominio)
+
+    def enviar(self, mensagens):
+        """
+        Recebe um iterável de (chave, mensagem) e produz (chave, erro) conforme os envios terminam.
+        `erro` é None em caso de sucesso ou EnvioAdiado se o domínio do destinatário estiver saturado.
+        """
+        # Limita as mensagens em memória para não montar a campanha inteira de uma vez
+        max_pendentes = self.workers * self.tamanho_lote
+        fila = FilaDominios(self.tamanho_lote)
+        resultados = queue.Queue()
+        pendentes = 0
+
+        threads = [
+            threading.Thread(target=self._trabalhar, args=(fila, resultados), name=f'envio-{i}', daemon=True)
+            for i in range(self.workers)
+        ]
+        for thread in threads:
+            thread.start()
+
+        concluido = False
+        try:
+            for chave, mensagem in mensagens:
+                adiamento = fila.colocar((chave, mensagem), dominio_mensagem(mensagem))
+                if adiamento:
+                    yield chave, adiamento
+                    continue
+                pendentes += 1
+
+                while pendentes >= max_pendentes:
+                    yield resultados.get()
+                    pendentes -= 1
+
+            fila.fechar()
+            while pendentes:
+                yield resultados.get()
+                pendentes -= 1
+            concluido = True
+        finally:
+            # Interrompido antes do fim: descartar o que ainda não foi enviado
+            fila.fechar(descartar=not concluido)
+            for thread in threads:
+                thread.join()
+            self.pool.fechar()
+
+def criar_despachante():
+    """Cria o despachante configurado em MARKETING_BACKEND_ENVIO ('threads' ou 'asyncio')"""
+    tipo = getattr(settings, 'MARKETING_BACKEND_ENVIO', 'threads')
+    if tipo == 'asyncio':
+        from .envio_async import DespachanteAssincrono
+        return DespachanteAssincrono()
+    if tipo != 'threads':
+        raise ImproperlyConfigured(f"MARKETING_BACKEND_ENVIO inválido: {tipo!r}")
+    return Despachante()
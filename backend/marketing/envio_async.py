@@ -0,0 +1,225 @@
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+import asyncio
+import logging
+import queue
+import threading
+
+from .envio import FilaDominios, dominio_mensagem, obter_limitador
+from .metricas import metricas
+
+try:
+    import aiosmtplib
+except ImportError:  # Dependência opcional, necessária apenas com MARKETING_BACKEND_ENVIO = 'asyncio'
+    aiosmtplib = None
+
+logger = logging.getLogger(__name__)
+
+class DespachanteAssincrono:
+    """
+    Envia mensagens por um número fixo de conexões SMTP assíncronas em um único event loop,
+    sem uma thread por conversa SMTP. Tem a mesma interface do Despachante, inclusive os
+    limites e a intercalação por domínio de destino.
+
+    O loop roda em uma thread própria: recebe as mensagens em lotes e devolve os resultados
+    também em lotes, para que o chamador grave os status no banco fora do loop.
+    """
+
+    def __init__(self, conexoes=None, tamanho_lote=None, taxa=None, **parametros):
+        if aiosmtplib is None:
+            raise ImproperlyConfigured("MARKETING_BACKEND_ENVIO = 'asyncio' requer o pacote aiosmtplib")
+
+        self.conexoes = conexoes or getattr(settings, 'MARKETING_CONEXOES_ASYNC', 20)
+        self.tamanho_lote = tamanho_lote or getattr(settings, 'MARKETING_LOTE_ENVIO', 50)
+        self.taxa = getattr(settings, 'MARKETING_TAXA_ENVIO_POR_HOST', 10) if taxa is None else taxa
+        self.parametros = {
+            'hostname': settings.EMAIL_HOST,
+            'port': settings.EMAIL_PORT,
+            'username': settings.EMAIL_HOST_USER or None,
+            'password': settings.EMAIL_HOST_PASSWORD or None,
+            'use_tls': getattr(settings, 'EMAIL_USE_SSL', False),
+            'start_tls': getattr(settings, 'EMAIL_USE_TLS', False),
+            'timeout': getattr(settings, 'EMAIL_TIMEOUT', None) or 60,
+        }
+        self.parametros.update(parametros)
+        self._erro = None
+
+    def _chave_host(self):
+        return f"{self.parametros['hostname']}:{self.parametros['port']}"
+
+    async def _aguardar_taxa(self, limitador):
+        espera = limitador.tentar_consumir()
+        while espera > 0:
+            await asyncio.sleep(espera)
+            espera = limitador.tentar_consumir()
+
+    async def _proxima(self, fila, sinal):
+        """Aguarda a próxima mensagem liberada pela fila de domínios; None quando ela se esgotar"""
+        while True:
+            obtido, espera = fila.tentar_obter()
+            if obtido is not None:
+                return obtido
+            if fila.fechada and not len(fila):
+                return None
+            sinal.clear()
+            try:
+                await asyncio.wait_for(sinal.wait(), espera)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _conexao(self, fila, sinal, resultados, saida):
+        """Mantém uma conexão SMTP aberta e envia sequencialmente as mensagens da fila"""
+        limitador = obter_limitador(self._chave_host(), self.taxa) if self.taxa else None
+        smtp = None
+        try:
+            while True:
+                obtido = await self._proxima(fila, sinal)
+                if obtido is None:
+                    return
+                dominio, (chave, mensagem) = obtido
+                try:
+                    if limitador:
+                        await self._aguardar_taxa(limitador)
+                    with metricas.medir('smtp'):
+                        if smtp is None or not smtp.is_connected:
+                            smtp = aiosmtplib.SMTP(**self.parametros)
+                            await smtp.connect()
+                        await smtp.send_message(
+                            mensagem.message(), sender=mensagem.from_email, recipients=mensagem.recipients()
+                        )
+                    resultados.append((chave, None))
+                except Exception as e:
+                    resultados.append((chave, e))
+                    # A conexão pode ter ficado em estado inválido; a próxima mensagem reconecta
+                    if smtp is not None:
+                        smtp.close()
+                        smtp = None
+                finally:
+                    fila.concluir(dominio)
+                    sinal.set()
+
+                if len(resultados) >= self.tamanho_lote:
+                    saida.put(resultados[:])
+                    resultados.clear()
+        finally:
+            if smtp is not None and smtp.is_connected:
+                try:
+                    await smtp.quit()
+                except Exception:
+                    smtp.close()
+
+    async def _executar(self, entrada, saida, descartar):
+        loop = asyncio.get_running_loop()
+        fila = FilaDominios(self.tamanho_lote)
+        sinal = asyncio.Event()
+        resultados = []
+        conexoes = [
+            asyncio.create_task(self._conexao(fila, sinal, resultados, saida)) for _ in range(self.conexoes)
+        ]
+        try:
+            while True:
+                lote = await loop.run_in_executor(None, entrada.get)
+                if lote is None:
+                    break
+                for chave, mensagem in lote:
+                    # Limita as mensagens em memória, com folga para um domínio saturado não bloquear os demais
+                    while len(fila) >= self.conexoes * 2 + self.tamanho_lote and not descartar.is_set():
+                        sinal.clear()
+                        await sinal.wait()
+                    if descartar.is_set():
+                        # Chamador interrompido: o restante deste lote e os lotes seguintes não são enviados
+                        break
+                    adiamento = fila.colocar((chave, mensagem), dominio_mensagem(mensagem))
+                    if adiamento:
+                        resultados.append((chave, adiamento))
+                    sinal.set()
+                # Entregar os resultados parciais a cada lote recebido, sem esperar encher o lote de saída
+                if resultados:
+                    saida.put(resultados[:])
+                    resultados.clear()
+            fila.fechar(descartar=descartar.is_set())
+            sinal.set()
+            await asyncio.gather(*conexoes)
+        except Exception as e:
+            logger.error(f"Erro no envio assíncrono: {str(e)}")
+            self._erro = e
+            for conexao in conexoes:
+                conexao.cancel()
+        finally:
+            if resultados:
+                saida.put(resultados[:])
+            saida.put(None)
+
+    def _entregar(self, entrada, lote, thread):
+        while True:
+            try:
+                entrada.put(lote, timeout=0.5)
+                return
+            except queue.Full:
+                if not thread.is_alive():
+                    raise RuntimeError('O loop de envio assíncrono foi encerrado') from self._erro
+
+    def _encerrar_entrada(self, entrada, thread):
+        """Sinaliza o fim da entrada ao loop, sem bloquear se ele já terminou"""
+        while thread.is_alive():
+            try:
+                entrada.put(None, timeout=0.5)
+                return
+            except queue.Full:
+                pass
+
+    def _drenar(self, saida):
+        while True:
+            try:
+                resultados = saida.get_nowait()
+            except queue.Empty:
+                return
+            if resultados is None:
+                # Fim antecipado do loop; devolver para a leitura final
+                saida.put(None)
+                return
+            yield from resultados
+
+    def enviar(self, mensagens):
+        """
+        Recebe um iterável de (chave, mensagem) e produz (chave, erro) conforme os envios terminam.
+        `erro` é None em caso de sucesso ou EnvioAdiado se o domínio do destinatário estiver saturado.
+        """
+        entrada = queue.Queue(maxsize=2)
+        saida = queue.Queue()
+        descartar = threading.Event()
+        thread = threading.Thread(
+            target=lambda: asyncio.run(self._executar(entrada, saida, descartar)), name='envio-async', daemon=True
+        )
+        thread.start()
+
+        entregue = concluido = False
+        try:
+            lote = []
+            for item in mensagens:
+                lote.append(item)
+                if len(lote) >= self.tamanho_lote:
+                    self._entregar(entrada, lote, thread)
+                    lote = []
+                    yield from self._drenar(saida)
+            if lote:
+                self._entregar(entrada, lote, thread)
+            entregue = True
+            self._encerrar_entrada(entrada, thread)
+
+            while True:
+                resultados = saida.get()
+                if resultados is None:
+                    break
+                yield from resultados
+            concluido = True
+        finally:
+            if not concluido and thread.is_alive():
+                # Interrompido antes do fim, como no Despachante: os resultados não seriam gravados,
+                # então o loop descarta as mensagens ainda não enviadas em vez de enviá-las
+                descartar.set()
+                if not entregue:
+                    self._encerrar_entrada(entrada, thread)
+            thread.join()
+        if self._erro is not None:
+            raise self._erro
@@ -0,0 +1,40 @@
+import csv
+import zlib
+
+class Eco:
+    """Pseudo-arquivo que devolve o que é escrito, para gerar linhas CSV sob demanda"""
+    def write(self, value):
+        return value
+
+def linhas_csv_emails(emails, linhas_por_bloco=500):
+    """Gera o CSV por destinatário em blocos de linhas, sem montar o arquivo em memória"""
+    writer = csv.writer(Eco())
+    yield writer.writerow(['Cliente', 'Email', 'Status', 'Data de Envio', 'Data de Abertura',
+                           'Data de Clique', 'Data de Resposta'])
+
+    formatar = lambda data: data.isoformat() if data else ''
+    bloco = []
+    for email in emails:
+        bloco.append(writer.writerow([
+            f"{email.cliente.nome} {email.cliente.sobrenome}",
+            email.cliente.email,
+            email.status,
+            formatar(email.data_envio),
+            formatar(email.data_abertura),
+            formatar(email.data_clique),
+            formatar(email.data_resposta),
+        ]))
+        if len(bloco) >= linhas_por_bloco:
+            yield ''.join(bloco)
+            bloco = []
+    if bloco:
+        yield ''.join(bloco)
+
+def compactar_gzip(blocos):
+    """Comprime em gzip, de forma incremental, os blocos de texto gerados"""
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    for bloco in blocos:
+        dados = compressor.compress(bloco.encode('utf-8'))
+        if dados:
+            yield dados
+    yield compressor.flush()
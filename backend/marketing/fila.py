@@ -0,0 +1,159 @@
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from datetime import timedelta
+import logging
+import os
+import socket
+import time
+import uuid
+
+from .envio import EnvioAdiado
+from .metricas import metricas
+from .models import Disparo, Email
+from .retentativas import calcular_espera, erro_transitorio
+
+logger = logging.getLogger(__name__)
+
+def identificador_worker():
+    """Identificador único do processo de envio (host, pid e um sufixo aleatório)"""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+def emails_disponiveis(agora=None):
+    """Emails que podem ser reservados: aguardando envio (e sem retentativa futura) ou com a reserva vencida"""
+    agora = agora or timezone.now()
+    return (
+        Q(status='aguardando') & (Q(proxima_tentativa__isnull=True) | Q(proxima_tentativa__lte=agora))
+    ) | Q(status='enviando', reservado_ate__lt=agora)
+
+def consultas_disponiveis(agora=None, **filtros):
+    """
+    Os emails disponíveis em duas consultas, cada uma servida por um índice: reservas vencidas
+    (email_reserva_idx) e emails aguardando envio (email_campanha_status_idx, já em ordem de id).
+    Com o OR de emails_disponiveis o banco percorreria todos os emails da campanha, inclusive os enviados.
+    """
+    agora = agora or timezone.now()
+    vencidos = Email.objects.filter(status='enviando', reservado_ate__lt=agora, **filtros)
+    aguardando = Email.objects.filter(status='aguardando', **filtros).filter(
+        Q(proxima_tentativa__isnull=True) | Q(proxima_tentativa__lte=agora)
+    )
+    return vencidos, aguardando
+
+def reservar_lote(campanha, worker, tamanho=None, duracao=None):
+    """
+    Reserva atomicamente até `tamanho` emails da campanha para o worker, passando-os
+    para 'enviando'. Dois workers nunca recebem o mesmo email enquanto a reserva vale.
+    """
+    tamanho = tamanho or getattr(settings, 'MARKETING_LOTE_RESERVA', 500)
+    duracao = duracao or getattr(settings, 'MARKETING_RESERVA_SEGUNDOS', 300)
+    agora = timezone.now()
+    expira = agora + timedelta(seconds=duracao)
+    disponiveis = emails_disponiveis(agora)
+    reserva = {'status': 'enviando', 'reservado_por': worker, 'reservado_ate': expira}
+
+    restantes = tamanho
+    with transaction.atomic():
+        # Primeiro as reservas vencidas, depois os emails aguardando envio
+        for candidatos in consultas_disponiveis(agora, campanha=campanha):
+            if restantes <= 0:
+                break
+            candidatos = candidatos.order_by('id')
+            if connection.features.has_select_for_update_skip_locked:
+                # Workers concorrentes pulam as linhas já travadas em vez de esperar por elas
+                ids = list(candidatos.select_for_update(skip_locked=True).values_list('id', flat=True)[:restantes])
+            else:
+                # Sem SELECT ... FOR UPDATE (ex.: SQLite), um único UPDATE com subconsulta é atômico
+                ids = candidatos.values('id')[:restantes]
+            # O filtro repetido descarta emails que outro worker reservou entre a consulta e o UPDATE
+            restantes -= Email.objects.filter(disponiveis, id__in=ids).update(**reserva)
+
+    # O par (worker, validade) identifica exatamente os emails desta reserva
+    return list(
+        Email.objects.filter(campanha=campanha, status='enviando', reservado_por=worker, reservado_ate=expira)
+        .select_related('cliente')
+        .order_by('id')
+    )
+
+def possui_pendentes(campanha):
+    """Indica se a campanha ainda tem emails aguardando envio, reservados ou ainda por criar"""
+    return (
+        Email.objects.filter(campanha=campanha, status__in=['aguardando', 'enviando']).exists()
+        or Disparo.objects.filter(campanha=campanha, status__in=['pendente', 'processando']).exists()
+    )
+
+class GravadorResultados:
+    """
+    Acumula os resultados do envio em memória e os grava em lotes com bulk_update.
+
+    Falhas transitórias voltam para 'aguardando' com a próxima tentativa agendada por backoff
+    exponencial, até MARKETING_MAX_TENTATIVAS; as demais falhas são definitivas.
+
+    Só entram no buffer mensagens que o servidor já aceitou ou recusou. Se o processo morrer
+    antes da gravação, os emails continuam 'enviando' e voltam à fila quando a reserva vence;
+    um email nunca é marcado como enviado sem ter sido enviado.
+    """
+
+    CAMPOS = ['status', 'data_envio', 'tentativas', 'proxima_tentativa', 'motivo_falha', 'reservado_por', 'reservado_ate']
+
+    def __init__(self, worker, tamanho_lote=None, intervalo=None, max_tentativas=None):
+        self.worker = worker
+        self.max_tentativas = max_tentativas or getattr(settings, 'MARKETING_MAX_TENTATIVAS', 5)
+        self.tamanho_lote = tamanho_lote or getattr(settings, 'MARKETING_LOTE_GRAVACAO', 500)
+        self.intervalo = getattr(settings, 'MARKETING_INTERVALO_GRAVACAO', 1.0) if intervalo is None else intervalo
+        self._pendentes = []
+        self._ultima_gravacao = time.monotonic()
+
+    def _acrescentar(self, email_obj):
+        email_obj.reservado_por = ''
+        email_obj.reservado_ate = None
+        self._pendentes.append(email_obj)
+        if len(self._pendentes) >= self.tamanho_lote or time.monotonic() - self._ultima_gravacao >= self.intervalo:
+            self.descarregar()
+
+    def registrar(self, email_obj, erro=None):
+        """Registra o resultado de uma tentativa de envio; retorna o novo status do email"""
+        if isinstance(erro, EnvioAdiado):
+            # Não chegou a ser tentado: o domínio do destinatário estava saturado
+            self.adiar(email_obj, erro.ate)
+            return email_obj.status
+        email_obj.tentativas += 1
+        email_obj.proxima_tentativa = None
+        if erro is None:
+            email_obj.status = 'enviado'
+            email_obj.data_envio = timezone.now()
+            email_obj.motivo_falha = ''
+        elif erro_transitorio(erro) and email_obj.tentativas < self.max_tentativas:
+            email_obj.status = 'aguardando'
+            email_obj.proxima_tentativa = timezone.now() + calcular_espera(email_obj.tentativas)
+            email_obj.motivo_falha = str(erro)
+            logger.warning(
+                f"Falha transitória ao enviar email para {email_obj.cliente.email} "
+                f"(tentativa {email_obj.tentativas}): {str(erro)}"
+            )
+        else:
+            logger.error(f"Erro ao enviar email para {email_obj.cliente.email}: {str(erro)}")
+            email_obj.status = 'falha'
+            email_obj.motivo_falha = str(erro)
+        self._acrescentar(email_obj)
+        return email_obj.status
+
+    def adiar(self, email_obj, ate, motivo=''):
+        """Devolve o email à fila sem tentar o envio nem consumir uma tentativa"""
+        email_obj.status = 'aguardando'
+        email_obj.proxima_tentativa = ate
+        if motivo:
+            email_obj.motivo_falha = motivo
+        self._acrescentar(email_obj)
+
+    def descarregar(self):
+        """Grava os resultados acumulados em uma transação"""
+        pendentes, self._pendentes = self._pendentes, []
+        self._ultima_gravacao = time.monotonic()
+        if not pendentes:
+            return 0
+        # O filtro pela reserva impede sobrescrever um email que já foi retomado por outro worker
+        with metricas.medir('gravacao'), transaction.atomic():
+            return Email.objects.filter(status='enviando', reservado_por=self.worker).bulk_update(
+                pendentes, self.CAMPOS, batch_size=self.tamanho_lote
+            )
@@ -0,0 +1,171 @@
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from datetime import timedelta
+import codecs
+import csv
+import logging
+
+from .models import Cliente, Importacao
+from .segmentos import invalidar_segmentos
+
+logger = logging.getLogger(__name__)
+
+TAMANHO_NOME = Cliente._meta.get_field('nome').max_length
+TAMANHO_SOBRENOME = Cliente._meta.get_field('sobrenome').max_length
+TAMANHO_EMAIL = Cliente._meta.get_field('email').max_length
+
+def linhas_do_arquivo(arquivo, encoding='utf-8-sig'):
+    """Decodifica o upload pedaço a pedaço, produzindo linhas sem carregar o arquivo inteiro"""
+    decodificador = codecs.getincrementaldecoder(encoding)()
+    resto = ''
+    for pedaco in arquivo.chunks():
+        # Quebrar só em \n, como o io.StringIO: o \r de um \r\n e separadores Unicode (U+2028, \x0c...)
+        # ficam para o módulo csv. A última linha pode estar incompleta e fica para o próximo pedaço
+        *linhas, resto = (resto + decodificador.decode(pedaco)).split('\n')
+        for linha in linhas:
+            yield linha + '\n'
+    texto = resto + decodificador.decode(b'', final=True)
+    if texto:
+        yield texto
+
+def _gravar_lote(lote):
+    """Insere ou atualiza um lote de (nome, sobrenome, email); retorna (criados, atualizados)"""
+    # O último registro de cada email no lote prevalece, como nas atualizações linha a linha
+    por_email = {}
+    for nome, sobrenome, email in lote:
+        por_email[email] = (nome, sobrenome)
+
+    with transaction.atomic():
+        existentes = set(Cliente.objects.filter(email__in=list(por_email)).values_list('email', flat=True))
+        Cliente.objects.bulk_create(
+            [Cliente(nome=nome, sobrenome=sobrenome, email=email) for email, (nome, sobrenome) in por_email.items()],
+            update_conflicts=True,
+            unique_fields=['email'],
+            update_fields=['nome', 'sobrenome']
+        )
+
+    criados = len(por_email) - len(existentes)
+    return criados, len(lote) - criados
+
+def importar_clientes_csv(arquivo, tamanho_lote=None, progresso=None, max_erros=None):
+    """
+    Importa clientes de um CSV (Nome, Sobrenome, Email) em lotes transacionais.
+    `progresso`, se informado, é chamado após cada lote com o resultado parcial e o número de linhas lidas.
+    Apenas as primeiras `max_erros` mensagens de erro são guardadas; `total_erros` conta todas.
+    """
+    tamanho_lote = tamanho_lote or getattr(settings, 'MARKETING_TAMANHO_LOTE', 1000)
+    max_erros = getattr(settings, 'MARKETING_IMPORTACAO_MAX_ERROS', 1000) if max_erros is None else max_erros
+    reader = csv.reader(linhas_do_arquivo(arquivo))
+    next(reader, None)  # Pular cabeçalho
+
+    resultado = {
+        'clientes_criados': 0,
+        'clientes_atualizados': 0,
+        'erros': [],
+        'total_erros': 0,
+    }
+    linhas_lidas = 0
+    lote = []
+
+    def registrar_erro(mensagem):
+        resultado['total_erros'] += 1
+        if len(resultado['erros']) < max_erros:
+            resultado['erros'].append(mensagem)
+
+    def gravar():
+        if lote:
+            try:
+                criados, atualizados = _gravar_lote(lote)
+                resultado['clientes_criados'] += criados
+                resultado['clientes_atualizados'] += atualizados
+            except Exception as e:
+                logger.error(f"Erro ao gravar lote de clientes: {str(e)}")
+                registrar_erro(f"Erro ao gravar lote de {len(lote)} linhas: {str(e)}")
+            lote.clear()
+        if progresso:
+            progresso(resultado, linhas_lidas)
+
+    try:
+        for row in reader:
+            linhas_lidas += 1
+            row = [campo.strip() for campo in row]
+            if not any(row):
+                continue
+
+            if len(row) >= 3:  # Verificar se a linha tem os campos necessários
+                nome, sobrenome, email = row[0], row[1], row[2]
+                try:
+                    validate_email(email)
+                    if len(nome) > TAMANHO_NOME or len(sobrenome) > TAMANHO_SOBRENOME or len(email) > TAMANHO_EMAIL:
+                        raise ValidationError('Campo excede o tamanho máximo')
+                except ValidationError as e:
+                    registrar_erro(f"Erro ao processar linha {nome}, {sobrenome}, {email}: {' '.join(e.messages)}")
+                    continue
+                lote.append((nome, sobrenome, email))
+            else:
+                registrar_erro(f"Linha com formato inválido: {','.join(row)}")
+
+            if len(lote) >= tamanho_lote:
+                gravar()
+
+        if lote or progresso:
+            gravar()
+    finally:
+        # Uma única invalidação dos segmentos por importação, não uma por lote
+        if resultado['clientes_criados'] or resultado['clientes_atualizados']:
+            invalidar_segmentos()
+
+    return resultado
+
+def reservar_importacao():
+    """Reserva atomicamente a próxima importação pendente (ou abandonada); None se não houver"""
+    limite_abandono = timezone.now() - timedelta(seconds=getattr(settings, 'MARKETING_IMPORTACAO_TIMEOUT', 600))
+    candidatas = Importacao.objects.filter(
+        Q(status='pendente') | Q(status='processando', data_atualizacao__lt=limite_abandono)
+    ).order_by('data_criacao').values_list('id', 'status')
+
+    for importacao_id, status_atual in candidatas[:10]:
+        # O filtro por status garante que dois workers não reservem a mesma importação
+        reservada = Importacao.objects.filter(id=importacao_id, status=status_atual).update(
+            status='processando',
+            data_inicio=timezone.now(),
+            data_atualizacao=timezone.now()
+        )
+        if reservada:
+            return Importacao.objects.get(id=importacao_id)
+    return None
+
+def processar_importacao(importacao):
+    """Executa a importação registrando o progresso a cada lote"""
+    max_erros = getattr(settings, 'MARKETING_IMPORTACAO_MAX_ERROS', 1000)
+
+    def progresso(resultado, linhas_lidas):
+        Importacao.objects.filter(id=importacao.id).update(
+            linhas_processadas=linhas_lidas,
+            clientes_criados=resultado['clientes_criados'],
+            clientes_atualizados=resultado['clientes_atualizados'],
+            total_erros=resultado['total_erros'],
+            erros=resultado['erros'],
+            data_atualizacao=timezone.now()
+        )
+
+    try:
+        with importacao.arquivo.open('rb') as arquivo:
+            importar_clientes_csv(arquivo, progresso=progresso, max_erros=max_erros)
+        Importacao.objects.filter(id=importacao.id).update(status='concluida', data_fim=timezone.now())
+    except Exception as e:
+        logger.error(f"Erro na importação {importacao.id}: {str(e)}")
+        importacao.refresh_from_db()
+        Importacao.objects.filter(id=importacao.id).update(
+            status='falha',
+            erros=(importacao.erros + [str(e)])[-max_erros:],
+            total_erros=importacao.total_erros + 1,
+            data_fim=timezone.now()
+        )
+
+    importacao.refresh_from_db()
+    return importacao
@@ -0,0 +1,109 @@
+from django.conf import settings
+from django.utils.http import base36_to_int, int_to_base36
+from base64 import urlsafe_b64encode
+from collections import OrderedDict
+from functools import lru_cache
+import hashlib
+import hmac
+import html
+import re
+import threading
+
+from .models import Campanha
+
+# Links absolutos em <a href>; URLs com {{campo}} são personalizadas e ficam como estão
+PADRAO_LINK = re.compile(r'''<a\s[^>]*?\bhref\s*=\s*(["'])(?P<valor>https?://[^"'{}\s<>]+)\1''', re.IGNORECASE)
+TAMANHO_ASSINATURA = 12  # Bytes do HMAC-SHA256 mantidos no token (96 bits)
+
+def extrair_links(texto):
+    """URLs dos links do HTML, na ordem em que aparecem e sem repetições, como escritas no HTML"""
+    return list(dict.fromkeys(encontrado.group('valor') for encontrado in PADRAO_LINK.finditer(texto)))
+
+def registrar_links(campanha):
+    """
+    Atribui um id a cada link do corpo da campanha e retorna {url como escrita no HTML: id}.
+    Os ids ficam em `campanha.links` e só crescem: editar o corpo não muda os links já enviados.
+    """
+    links = list(campanha.links or [])
+    ids = {url: indice + 1 for indice, url in enumerate(links)}
+    resultado = {}
+    novos = False
+    for escrito in extrair_links(campanha.corpo):
+        url = html.unescape(escrito)
+        if url not in ids:
+            links.append(url)
+            ids[url] = len(links)
+            novos = True
+        resultado[escrito] = ids[url]
+
+    if novos:
+        campanha.links = links
+        if campanha.pk:
+            Campanha.objects.filter(pk=campanha.pk).update(links=links)
+    return resultado
+
+@lru_cache(maxsize=4)
+def _derivar_chave(segredo):
+    return hashlib.sha256(b'marketing.links:' + segredo.encode()).digest()
+
+def _assinatura(corpo):
+    chave = _derivar_chave(getattr(settings, 'MARKETING_LINKS_SEGREDO', None) or settings.SECRET_KEY)
+    digest = hmac.new(chave, corpo.encode(), hashlib.sha256).digest()[:TAMANHO_ASSINATURA]
+    return urlsafe_b64encode(digest).decode().rstrip('=')
+
+def assinar_token(campanha_id, email_id, link_id):
+    """Token compacto 'campanha.email.link.assinatura' com os ids em base 36"""
+    corpo = f"{int_to_base36(campanha_id)}.{int_to_base36(email_id)}.{int_to_base36(link_id)}"
+    return f"{corpo}.{_assinatura(corpo)}"
+
+def verificar_token(token):
+    """Retorna (campanha_id, email_id, link_id) se a assinatura for válida; None caso contrário. Não acessa o banco"""
+    corpo, _, assinatura = token.rpartition('.')
+    partes = corpo.split('.')
+    if len(partes) != 3 or not hmac.compare_digest(_assinatura(corpo), assinatura):
+        return None
+    try:
+        return tuple(base36_to_int(parte) for parte in partes)
+    except ValueError:
+        return None
+
+def url_clique(campanha_id, email_id, link_id):
+    return f"{settings.BASE_URL}/api/l/{assinar_token(campanha_id, email_id, link_id)}/"
+
+class CacheLinks:
+    """
+    Cache LRU dos links de cada campanha para o redirecionamento dos cliques.
+    Como os ids só crescem, a lista em cache só é recarregada ao pedir um id que ela ainda não tem.
+    """
+
+    def __init__(self, maximo=1000):
+        self.maximo = maximo
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+
+    def url(self, campanha_id, link_id):
+        """URL original do link, ou None se a campanha ou o link não existirem"""
+        with self._lock:
+            links = self._entradas.get(campanha_id)
+            if links is not None:
+                self._entradas.move_to_end(campanha_id)
+
+        if links is None or link_id > len(links):
+            links = Campanha.objects.filter(id=campanha_id).values_list('links', flat=True).first()
+            if links is None:
+                return None
+            with self._lock:
+                self._entradas[campanha_id] = links
+                self._entradas.move_to_end(campanha_id)
+                while len(self._entradas) > self.maximo:
+                    self._entradas.popitem(last=False)
+
+        if 1 <= link_id <= len(links):
+            return links[link_id - 1]
+        return None
+
+    def limpar(self):
+        with self._lock:
+            self._entradas.clear()
+
+cache_links = CacheLinks()
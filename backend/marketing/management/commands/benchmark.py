@@ -0,0 +1,168 @@
+from django.core.management.base import BaseCommand, CommandError
+from marketing.benchmarks import (
+    benchmark_carga, benchmark_envio, benchmark_envio_campanha, benchmark_envio_smtp, benchmark_importacao,
+    benchmark_metricas, benchmark_publico, benchmark_rastreamento, benchmark_renderizacao,
+    comparar_resultados, executar_suite, salvar_resultados
+)
+import json
+
+CENARIOS = [
+    'envio', 'envio_smtp', 'renderizacao', 'rastreamento', 'carga',
+    'publico', 'importacao', 'envio_campanha', 'metricas', 'suite',
+]
+
+class Command(BaseCommand):
+    help = 'Executa benchmarks de desempenho do envio de campanhas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('cenario', choices=CENARIOS, help='Cenário a ser medido (suite executa publico, importacao, '
+                                                             'envio_campanha, metricas e rastreamento)')
+        parser.add_argument('--mensagens', type=int, default=1000, help='Quantidade de mensagens enviadas')
+        parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8], help='Números de workers a comparar')
+        parser.add_argument('--latencia', type=float, default=0.01,
+                            help='Latência simulada por mensagem em segundos (ignorada com --backend)')
+        parser.add_argument('--backend', help='Backend de email real, ex.: django.core.mail.backends.smtp.EmailBackend '
+                                              'apontando para um aiosmtpd local')
+        parser.add_argument('--conexoes', type=int, nargs='+', default=[1, 4, 16, 64],
+                            help='Conexões SMTP simultâneas a comparar (envio_smtp)')
+        parser.add_argument('--todos-nucleos', action='store_true',
+                            help='Não restringir o benchmark a uma CPU (envio_smtp)')
+        parser.add_argument('--destinatarios', type=int, default=10000, help='Destinatários personalizados (renderizacao)')
+        parser.add_argument('--tamanho-corpo', type=int, default=50000, help='Tamanho aproximado do corpo HTML em bytes (renderizacao)')
+        parser.add_argument('--requisicoes', type=int, default=2000, help='Requisições ao pixel por rota (rastreamento)')
+        parser.add_argument('--duracao', type=float, default=10, help='Segundos de carga por configuração (carga)')
+        parser.add_argument('--remetentes', type=int, default=2, help='Threads reservando e gravando envios (carga)')
+        parser.add_argument('--rastreadores', type=int, default=4, help='Threads gravando aberturas (carga)')
+        parser.add_argument('--sem-buffer', action='store_true', help='Gravar cada abertura imediatamente (rastreamento)')
+        parser.add_argument('--clientes', type=int, default=10000,
+                            help='Clientes sintéticos gerados (publico, importacao, envio_campanha, metricas, suite)')
+        parser.add_argument('--json', dest='arquivo_json', help='Gravar os resultados neste arquivo JSON')
+        parser.add_argument('--comparar', help='Arquivo JSON de uma execução anterior para comparar a vazão')
+
+    def executar(self, cenario, options):
+        if cenario == 'envio':
+            return benchmark_envio(
+                mensagens=options['mensagens'],
+                workers=options['workers'],
+                latencia=options['latencia'],
+                backend=options['backend']
+            )
+        if cenario == 'envio_smtp':
+            return benchmark_envio_smtp(
+                mensagens=options['mensagens'],
+                conexoes=options['conexoes'],
+                um_nucleo=not options['todos_nucleos']
+            )
+        if cenario == 'renderizacao':
+            return benchmark_renderizacao(
+                destinatarios=options['destinatarios'],
+                tamanho_corpo=options['tamanho_corpo']
+            )
+        if cenario == 'rastreamento':
+            return benchmark_rastreamento(
+                requisicoes=options['requisicoes'],
+                buffer=not options['sem_buffer']
+            )
+        if cenario == 'carga':
+            return benchmark_carga(
+                duracao=options['duracao'],
+                remetentes=options['remetentes'],
+                rastreadores=options['rastreadores']
+            )
+        if cenario == 'publico':
+            return benchmark_publico(clientes=options['clientes'])
+        if cenario == 'importacao':
+            return benchmark_importacao(linhas=options['clientes'])
+        if cenario == 'envio_campanha':
+            return benchmark_envio_campanha(clientes=options['clientes'])
+        if cenario == 'metricas':
+            return benchmark_metricas(emails=options['clientes'])
+
+    def exibir(self, cenario, resultados):
+        for resultado in resultados:
+            if cenario == 'envio':
+                linha = (
+                    f"{resultado['workers']} workers: {resultado['mensagens_por_segundo']} msgs/s "
+                    f"({resultado['mensagens']} mensagens em {resultado['segundos']}s, {resultado['falhas']} falhas)"
+                )
+            elif cenario == 'envio_smtp':
+                linha = (
+                    f"{resultado['despachante']} com {resultado['conexoes']} conexões: "
+                    f"{resultado['mensagens_por_segundo']} msgs/s "
+                    f"({resultado['mensagens']} mensagens em {resultado['segundos']}s, {resultado['falhas']} falhas)"
+                )
+            elif cenario == 'renderizacao':
+                linha = (
+                    f"{resultado['metodo']}: {resultado['renderizacoes_por_segundo']} renderizações/s "
+                    f"({resultado['destinatarios']} destinatários, corpo de {resultado['tamanho_corpo']} bytes, "
+                    f"{resultado['segundos']}s)"
+                )
+            elif cenario == 'rastreamento':
+                linha = (
+                    f"{resultado['rota']}: {resultado['requisicoes_por_segundo']} requisições/s "
+                    f"({resultado['requisicoes']} requisições em {resultado['segundos']}s, buffer={resultado['buffer']})"
+                )
+            elif cenario == 'carga':
+                linha = (
+                    f"{resultado['configuracao']}: {resultado['gravacoes_por_segundo']} gravações do pixel/s "
+                    f"({resultado['erros_pixel']} erros) com {resultado['envios_por_segundo']} envios/s "
+                    f"({resultado['erros_envio']} erros) em {resultado['segundos']}s"
+                )
+            elif cenario == 'publico':
+                linha = (
+                    f"{resultado['campanha']}: {resultado['publico']} destinatários de {resultado['clientes']} clientes, "
+                    f"consulta em {resultado['segundos_consulta']}s, {resultado['emails_por_segundo']} emails criados/s"
+                )
+            elif cenario == 'importacao':
+                linha = (
+                    f"{resultado['operacao']}: {resultado['linhas_por_segundo']} linhas/s "
+                    f"({resultado['criados']} criados, {resultado['atualizados']} atualizados, {resultado['erros']} erros "
+                    f"em {resultado['segundos']}s)"
+                )
+            elif cenario == 'envio_campanha':
+                linha = (
+                    f"{resultado['mensagens_por_segundo']} msgs/s ({resultado['enviados']} enviados, "
+                    f"{resultado['falhas']} falhas em {resultado['segundos']}s)"
+                )
+            else:
+                linha = (
+                    f"{resultado['milissegundos_por_atualizacao']} ms por atualização de {resultado['emails']} emails "
+                    f"({resultado['emails_por_segundo']} emails/s)"
+                )
+            self.stdout.write(self.style.SUCCESS(linha))
+
+    def handle(self, *args, **options):
+        anterior = None
+        if options['comparar']:
+            try:
+                with open(options['comparar'], encoding='utf-8') as arquivo:
+                    anterior = json.load(arquivo)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Não foi possível ler {options['comparar']}: {str(e)}")
+
+        cenario = options['cenario']
+        if cenario == 'suite':
+            resultados = executar_suite(clientes=options['clientes'], requisicoes=options['requisicoes'])
+        else:
+            resultados = {cenario: self.executar(cenario, options)}
+
+        for nome, linhas in resultados.items():
+            if len(resultados) > 1:
+                self.stdout.write(f'[{nome}]')
+            self.exibir(nome, linhas)
+
+        parametros = {
+            chave: options[chave] for chave in (
+                'cenario', 'clientes', 'mensagens', 'workers', 'latencia', 'conexoes', 'destinatarios',
+                'tamanho_corpo', 'requisicoes', 'duracao', 'remetentes', 'rastreadores', 'sem_buffer'
+            )
+        }
+        documento = {'resultados': resultados}
+        if options['arquivo_json']:
+            documento = salvar_resultados(options['arquivo_json'], resultados, parametros)
+            self.stdout.write(f"Resultados gravados em {options['arquivo_json']}")
+
+        if anterior:
+            self.stdout.write(f"Comparação com {anterior.get('commit') or options['comparar']}:")
+            for nome, descricao, antes, depois, variacao in comparar_resultados(anterior, documento):
+                self.stdout.write(f"{nome} {descricao}: {antes} -> {depois} ({variacao:+.1f}%)")
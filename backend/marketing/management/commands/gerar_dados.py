@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+from marketing.dados_sinteticos import gerar_dados
+import time
+
+class Command(BaseCommand):
+    help = 'Gera clientes, grupos e campanhas sintéticos para testes de desempenho'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clientes', type=int, default=10000, help='Clientes a criar (ex.: 10000 a 10000000)')
+        parser.add_argument('--grupos', type=int, default=20, help='Grupos a criar')
+        parser.add_argument('--grupos-por-cliente', type=float, default=2.0,
+                            help='Média de grupos por cliente; valores maiores aumentam a sobreposição')
+        parser.add_argument('--campanhas', type=int, default=5,
+                            help='Campanhas em rascunho a criar (a primeira é para todos os clientes)')
+        parser.add_argument('--semente', type=int, default=42, help='Semente do gerador, para repetir a mesma base')
+        parser.add_argument('--lote', type=int, default=None, help='Clientes gravados por transação')
+
+    def handle(self, *args, **options):
+        if options['clientes'] < 0 or options['grupos'] < 0 or options['campanhas'] < 0:
+            raise CommandError('As quantidades não podem ser negativas')
+
+        inicio = time.monotonic()
+        passo = max(1, options['clientes'] // 20)
+        exibidos = {'clientes': 0}
+
+        def progresso(criados, total):
+            if criados - exibidos['clientes'] >= passo or criados == total:
+                exibidos['clientes'] = criados
+                self.stdout.write(f'{criados}/{total} clientes ({time.monotonic() - inicio:.1f}s)')
+
+        totais = gerar_dados(
+            clientes=options['clientes'],
+            grupos=options['grupos'],
+            campanhas=options['campanhas'],
+            grupos_por_cliente=options['grupos_por_cliente'],
+            semente=options['semente'],
+            tamanho_lote=options['lote'],
+            progresso=progresso
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"{totais['clientes']} clientes, {totais['grupos']} grupos ({totais['participacoes']} participações) e "
+            f"{totais['campanhas']} campanhas criados em {time.monotonic() - inicio:.1f}s"
+        ))
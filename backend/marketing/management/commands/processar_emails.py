@@ -1,17 +1,47 @@
 from django.core.management.base import BaseCommand
 from django.utils import timezone
+from marketing.disparos import processar_disparo, reservar_disparo
+from marketing.fila import possui_pendentes
+from marketing.metricas import metricas
 from marketing.models import Campanha, Email
 from marketing.tasks import processar_campanhas_agendadas, processar_envio_campanha
 
 class Command(BaseCommand):
     help = 'Processa campanhas de email agendadas'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--daemon', action='store_true',
+                            help='Executar continuamente, aguardando as próximas campanhas agendadas')
+        parser.add_argument('--processos', type=int, default=None,
+                            help='Campanhas enviadas em paralelo no modo daemon')
+        parser.add_argument('--espera-maxima', type=float, default=None,
+                            help='Segundos máximos entre verificações no modo daemon')
+
     def handle(self, *args, **options):
+        if options['daemon']:
+            from marketing.agendador import Agendador
+
+            Agendador(
+                processos=options['processos'],
+                espera_maxima=options['espera_maxima'],
+                escrever=lambda mensagem: self.stdout.write(self.style.SUCCESS(mensagem))
+            ).executar()
+            return
+
         self.stdout.write(self.style.SUCCESS('Iniciando processamento de campanhas agendadas...'))
         
         # Processar campanhas agendadas
         processar_campanhas_agendadas()
         
+        # Criar os emails das campanhas iniciadas pela API
+        disparo = reservar_disparo()
+        while disparo:
+            disparo = processar_disparo(disparo)
+            self.stdout.write(self.style.SUCCESS(
+                f'Disparo {disparo.id}: {disparo.emails_criados} emails criados para a campanha {disparo.campanha.titulo}'
+            ))
+            disparo = reservar_disparo()
+        
         # Buscar campanhas em andamento
         campanhas_em_andamento = Campanha.objects.filter(status='enviando')
         
@@ -20,13 +50,13 @@ class Command(BaseCommand):
             
             for campanha in campanhas_em_andamento:
                 # Verificar se ainda há emails pendentes
-                emails_pendentes = Email.objects.filter(campanha=campanha, status='aguardando').count()
+                emails_pendentes = Email.objects.filter(campanha=campanha, status__in=['aguardando', 'enviando']).count()
                 
                 if emails_pendentes > 0:
                     self.stdout.write(self.style.SUCCESS(f'Campanha {campanha.titulo}: {emails_pendentes} emails pendentes'))
                     resultado = processar_envio_campanha(campanha)
-                    self.stdout.write(self.style.SUCCESS(f'Enviados: {resultado["enviados"]}, Falhas: {resultado.get("falhas", 0)}'))
-                else:
+                    self.stdout.write(self.style.SUCCESS(f'Enviados: {resultado["enviados"]}, Falhas: {resultado.get("falhas", 0)}, Reagendados: {resultado.get("reagendados", 0)}'))
+                elif not possui_pendentes(campanha):
                     self.stdout.write(self.style.SUCCESS(f'Campanha {campanha.titulo}: todos os emails processados'))
                     
                     # Marcar como concluída se todos os emails foram processados
@@ -34,4 +64,6 @@ class Command(BaseCommand):
                     campanha.data_fim_envio = timezone.now()
                     campanha.save()
         
+        if metricas.ativo:
+            self.stdout.write(self.style.SUCCESS(metricas.resumo()))
         self.stdout.write(self.style.SUCCESS('Processamento de campanhas concluído!')) 
\ No newline at end of file
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from marketing.importacao import reservar_importacao, processar_importacao
+import time
+
+class Command(BaseCommand):
+    help = 'Processa as importações de clientes enviadas de forma assíncrona'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--continuo', action='store_true',
+                            help='Continua aguardando novas importações em vez de encerrar quando a fila esvaziar')
+        parser.add_argument('--intervalo', type=float, default=5.0,
+                            help='Segundos entre as verificações da fila no modo contínuo')
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('Iniciando processamento de importações...'))
+        
+        while True:
+            importacao = reservar_importacao()
+            
+            if importacao is None:
+                if not options['continuo']:
+                    break
+                time.sleep(options['intervalo'])
+                continue
+            
+            self.stdout.write(self.style.SUCCESS(f'Processando importação {importacao.id}'))
+            importacao = processar_importacao(importacao)
+            self.stdout.write(self.style.SUCCESS(
+                f'Importação {importacao.id} {importacao.get_status_display().lower()}: '
+                f'{importacao.linhas_processadas} linhas, {importacao.clientes_criados} criados, '
+                f'{importacao.clientes_atualizados} atualizados, {importacao.total_erros} erros'
+            ))
+        
+        self.stdout.write(self.style.SUCCESS('Processamento de importações concluído!'))
@@ -0,0 +1,246 @@
+from django.conf import settings
+from bisect import bisect_left
+import math
+import threading
+import time
+
+# Limites superiores (segundos) dos buckets dos histogramas de latência
+BUCKETS_PADRAO = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+DESCRICOES = {
+    'marketing_fase_segundos': 'Duração de cada fase do envio e do rastreamento',
+    'marketing_emails_total': 'Resultados de envio por status',
+    'marketing_campanha_emails_total': 'Resultados de envio por campanha e status',
+    'marketing_campanha_msgs_por_segundo': 'Vazão da última execução de envio da campanha',
+    'marketing_rastreamento_eventos_total': 'Eventos de rastreamento recebidos',
+    'marketing_fila_emails': 'Emails na fila de envio por status',
+    'marketing_fila_disparos': 'Disparos aguardando ou criando emails',
+    'marketing_rastreamento_buffer': 'Emails com eventos de rastreamento ainda não gravados',
+}
+
+def _chave_rotulos(rotulos):
+    return tuple(sorted(rotulos.items()))
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _formatar_rotulos(rotulos, extra=()):
+    pares = list(rotulos) + list(extra)
+    if not pares:
+        return ''
+    return '{' + ','.join(f'{nome}="{_escapar(valor)}"' for nome, valor in pares) + '}'
+
+def _formatar_valor(valor):
+    if valor == math.inf:
+        return '+Inf'
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+class Histograma:
+    """Contagens cumulativas por bucket, soma e total de observações"""
+
+    __slots__ = ('buckets', 'contagens', 'soma', 'total')
+
+    def __init__(self, buckets=BUCKETS_PADRAO):
+        self.buckets = buckets
+        self.contagens = [0] * (len(buckets) + 1)
+        self.soma = 0.0
+        self.total = 0
+
+    def observar(self, valor):
+        self.contagens[bisect_left(self.buckets, valor)] += 1
+        self.soma += valor
+        self.total += 1
+
+    def mesclar(self, contagens, soma, total):
+        for i, quantidade in enumerate(contagens):
+            self.contagens[i] += quantidade
+        self.soma += soma
+        self.total += total
+
+    def quantil(self, q):
+        """Limite superior do bucket que contém o quantil `q` (aproximação do histograma)"""
+        if not self.total:
+            return 0.0
+        alvo = q * self.total
+        acumulado = 0
+        for i, quantidade in enumerate(self.contagens):
+            acumulado += quantidade
+            if acumulado >= alvo:
+                return self.buckets[i] if i < len(self.buckets) else math.inf
+        return math.inf
+
+class _Medicao:
+    __slots__ = ('metricas', 'fase', 'rotulos', 'inicio')
+
+    def __init__(self, metricas, fase, rotulos):
+        self.metricas = metricas
+        self.fase = fase
+        self.rotulos = rotulos
+
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metricas.observar('marketing_fase_segundos', time.perf_counter() - self.inicio, fase=self.fase, **self.rotulos)
+        return False
+
+class _MedicaoDesativada:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_MEDICAO_DESATIVADA = _MedicaoDesativada()
+
+class Metricas:
+    """
+    Contadores, gauges e histogramas de latência mantidos em memória pelo processo.
+    Com MARKETING_METRICAS = False cada chamada retorna logo após verificar a configuração.
+    """
+
+    def __init__(self, buckets=BUCKETS_PADRAO):
+        self.buckets = buckets
+        self._contadores = {}
+        self._gauges = {}
+        self._histogramas = {}
+        self._lock = threading.Lock()
+        self._inicio = time.monotonic()
+
+    @property
+    def ativo(self):
+        return getattr(settings, 'MARKETING_METRICAS', True)
+
+    def incrementar(self, nome, valor=1, **rotulos):
+        if not self.ativo:
+            return
+        chave = (nome, _chave_rotulos(rotulos))
+        with self._lock:
+            self._contadores[chave] = self._contadores.get(chave, 0) + valor
+
+    def definir(self, nome, valor, **rotulos):
+        if not self.ativo:
+            return
+        with self._lock:
+            self._gauges[(nome, _chave_rotulos(rotulos))] = valor
+
+    def observar(self, nome, valor, **rotulos):
+        if not self.ativo:
+            return
+        chave = (nome, _chave_rotulos(rotulos))
+        with self._lock:
+            histograma = self._histogramas.get(chave)
+            if histograma is None:
+                histograma = self._histogramas[chave] = Histograma(self.buckets)
+            histograma.observar(valor)
+
+    def medir(self, fase, **rotulos):
+        """Context manager que registra a duração do bloco no histograma da fase"""
+        if not self.ativo:
+            return _MEDICAO_DESATIVADA
+        return _Medicao(self, fase, rotulos)
+
+    def exportar(self):
+        """Cópia serializável (pickle) das métricas, usada para somá-las às de outro processo"""
+        with self._lock:
+            return {
+                'contadores': dict(self._contadores),
+                'gauges': dict(self._gauges),
+                'histogramas': {
+                    chave: (list(h.contagens), h.soma, h.total) for chave, h in self._histogramas.items()
+                },
+            }
+
+    def mesclar(self, dados):
+        """Soma as métricas exportadas por outro processo às deste"""
+        if not self.ativo or not dados:
+            return
+        with self._lock:
+            for chave, valor in dados['contadores'].items():
+                self._contadores[chave] = self._contadores.get(chave, 0) + valor
+            self._gauges.update(dados['gauges'])
+            for chave, (contagens, soma, total) in dados['histogramas'].items():
+                histograma = self._histogramas.get(chave)
+                if histograma is None:
+                    histograma = self._histogramas[chave] = Histograma(self.buckets)
+                histograma.mesclar(contagens, soma, total)
+
+    def limpar(self):
+        with self._lock:
+            self._contadores.clear()
+            self._gauges.clear()
+            self._histogramas.clear()
+            self._inicio = time.monotonic()
+
+    def formato_prometheus(self, gauges=None):
+        """
+        Texto no formato de exposição do Prometheus (0.0.4). `gauges` acrescenta valores medidos
+        na hora da coleta, como {(nome, (('status', 'aguardando'),)): 10}.
+        """
+        with self._lock:
+            contadores = dict(self._contadores)
+            valores = dict(self._gauges)
+            histogramas = {chave: (list(h.contagens), h.soma, h.total) for chave, h in self._histogramas.items()}
+        valores.update(gauges or {})
+
+        linhas = []
+        def cabecalho(nome, tipo):
+            if nome in DESCRICOES:
+                linhas.append(f'# HELP {nome} {DESCRICOES[nome]}')
+            linhas.append(f'# TYPE {nome} {tipo}')
+
+        for tipo, series in (('counter', contadores), ('gauge', valores)):
+            for nome in sorted({nome for nome, _ in series}):
+                cabecalho(nome, tipo)
+                for (nome_serie, rotulos), valor in sorted(series.items(), key=lambda item: str(item[0])):
+                    if nome_serie == nome:
+                        linhas.append(f'{nome}{_formatar_rotulos(rotulos)} {_formatar_valor(valor)}')
+
+        for nome in sorted({nome for nome, _ in histogramas}):
+            cabecalho(nome, 'histogram')
+            for (nome_serie, rotulos), (contagens, soma, total) in sorted(histogramas.items(), key=lambda item: str(item[0])):
+                if nome_serie != nome:
+                    continue
+                acumulado = 0
+                for limite, quantidade in zip(self.buckets + (math.inf,), contagens):
+                    acumulado += quantidade
+                    linhas.append(
+                        f'{nome}_bucket{_formatar_rotulos(rotulos, [("le", _formatar_valor(limite))])} {acumulado}'
+                    )
+                linhas.append(f'{nome}_sum{_formatar_rotulos(rotulos)} {_formatar_valor(soma)}')
+                linhas.append(f'{nome}_count{_formatar_rotulos(rotulos)} {total}')
+
+        return '\n'.join(linhas) + '\n'
+
+    def resumo(self):
+        """Linha com o tempo de cada fase e os totais de envio desde o início (ou a última limpeza)"""
+        with self._lock:
+            fases = {}
+            for (nome, rotulos), histograma in self._histogramas.items():
+                fase = dict(rotulos).get('fase')
+                if nome != 'marketing_fase_segundos' or fase is None:
+                    continue
+                agregado = fases.setdefault(fase, Histograma(self.buckets))
+                agregado.mesclar(histograma.contagens, histograma.soma, histograma.total)
+            emails = {}
+            for (nome, rotulos), valor in self._contadores.items():
+                if nome == 'marketing_emails_total':
+                    status = dict(rotulos).get('status')
+                    emails[status] = emails.get(status, 0) + valor
+            decorrido = time.monotonic() - self._inicio
+
+        partes = [
+            f'{fase} {h.total}x {h.soma:.2f}s (média {h.soma / h.total * 1000:.1f}ms, p95 ≤{h.quantil(0.95) * 1000:g}ms)'
+            for fase, h in sorted(fases.items(), key=lambda item: -item[1].soma) if h.total
+        ]
+        enviados = emails.get('enviado', 0)
+        totais = (
+            f"{enviados} enviados, {emails.get('falha', 0)} falhas, {emails.get('aguardando', 0)} reagendados, "
+            f"{enviados / decorrido if decorrido else 0:.1f} msgs/s"
+        )
+        return 'Métricas: ' + ('; '.join(partes) + ' | ' if partes else '') + totais
+
+metricas = Metricas()
@@ -0,0 +1,31 @@
+from django.db import migrations, models
+
+
+def remover_emails_duplicados(apps, schema_editor):
+    # Mantém apenas o primeiro email de cada par (campanha, cliente) antes de criar a restrição
+    Email = apps.get_model('marketing', 'Email')
+    duplicados = (
+        Email.objects.values('campanha_id', 'cliente_id')
+        .annotate(primeiro_id=models.Min('id'), total=models.Count('id'))
+        .filter(total__gt=1)
+    )
+    for duplicado in duplicados.iterator():
+        Email.objects.filter(
+            campanha_id=duplicado['campanha_id'],
+            cliente_id=duplicado['cliente_id'],
+        ).exclude(id=duplicado['primeiro_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketing', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(remover_emails_duplicados, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='email',
+            constraint=models.UniqueConstraint(fields=('campanha', 'cliente'), name='unique_email_campanha_cliente'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.4 on 2026-10-18 10:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketing', '0002_email_unique_campanha_cliente'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Importacao',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('arquivo', models.FileField(upload_to='importacoes/')),
+                ('status', models.CharField(choices=[('pendente', 'Pendente'), ('processando', 'Processando'), ('concluida', 'Concluída'), ('falha', 'Falha')], default='pendente', max_length=20)),
+                ('linhas_processadas', models.IntegerField(default=0)),
+                ('clientes_criados', models.IntegerField(default=0)),
+                ('clientes_atualizados', models.IntegerField(default=0)),
+                ('total_erros', models.IntegerField(default=0)),
+                ('erros', models.JSONField(blank=True, default=list)),
+                ('data_criacao', models.DateTimeField(auto_now_add=True)),
+                ('data_atualizacao', models.DateTimeField(auto_now=True)),
+                ('data_inicio', models.DateTimeField(blank=True, null=True)),
+                ('data_fim', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
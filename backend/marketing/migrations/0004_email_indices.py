@@ -0,0 +1,21 @@
+# Generated by Django 4.2.4 on 2026-10-18 10:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketing', '0003_importacao'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='email',
+            index=models.Index(fields=['campanha', 'status'], name='email_campanha_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='email',
+            index=models.Index(fields=['campanha', 'data_envio'], name='email_campanha_envio_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.4 on 2026-10-18 10:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketing', '0004_email_indices'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='campanha',
+            index=models.Index(fields=['status', 'data_agendamento'], name='campanha_status_agenda_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='campanha',
+            index=models.Index(condition=models.Q(('status', 'agendada')), fields=['data_agendamento'], name='campanha_agendada_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='email',
+            index=models.Index(condition=models.Q(('status', 'aguardando')), fields=['campanha'], name='email_aguardando_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.4 on 2026-10-18 10:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketing', '0005_indices_consultas_frequentes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='email',
+            name='reservado_ate',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='email',
+            name='reservado_por',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='email',
+            name='status',
+            field=models.CharField(choices=[('aguardando', 'Aguardando Envio'), ('enviando', 'Enviando'), ('enviado', 'Enviado'), ('falha', 'Falha no Envio'), ('aberto', 'Aberto'), ('clicado', 'Clicado'), ('respondido', 'Respondido')], default='aguardando', max_length=20),
+        ),
+    ]
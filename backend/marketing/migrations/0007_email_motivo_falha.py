@@ -0,0 +1,18 @@
+# Generated by Django 4.2.4 on 2026-10-18 10:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketing', '0006_email_reserva'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='email',
+            name='motivo_falha',
+            field=models.TextField(blank=True),
+        ),
+    ]
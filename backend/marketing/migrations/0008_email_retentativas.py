@@ -0,0 +1,23 @@
+# Generated by Django 4.2.4 on 2026-10-18 10:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketing', '0007_email_motivo_falha'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='email',
+            name='proxima_tentativa',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='email',
+            name='tentativas',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.4 on 2026-10-18 11:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketing', '0008_email_retentativas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Disparo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pendente', 'Pendente'), ('processando', 'Processando'), ('concluido', 'Concluído'), ('falha', 'Falha')], default='pendente', max_length=20)),
+                ('clientes_processados', models.IntegerField(default=0)),
+                ('emails_criados', models.IntegerField(default=0)),
+                ('erro', models.TextField(blank=True)),
+                ('data_criacao', models.DateTimeField(auto_now_add=True)),
+                ('data_atualizacao', models.DateTimeField(auto_now=True)),
+                ('data_inicio', models.DateTimeField(blank=True, null=True)),
+                ('data_fim', models.DateTimeField(blank=True, null=True)),
+                ('campanha', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='disparos', to='marketing.campanha')),
+            ],
+        ),
+    ]
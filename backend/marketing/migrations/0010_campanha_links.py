@@ -0,0 +1,18 @@
+# Generated by Django 4.2.4 on 2026-10-18 11:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketing', '0009_disparo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='campanha',
+            name='links',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.4 on 2026-10-18 11:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketing', '0010_campanha_links'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Segmento',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nome', models.CharField(max_length=100)),
+                ('descricao', models.TextField(blank=True)),
+                ('regras', models.JSONField(blank=True, default=dict)),
+                ('versao', models.BigIntegerField(default=0)),
+                ('versao_cache', models.BigIntegerField(blank=True, null=True)),
+                ('total_cache', models.IntegerField(blank=True, null=True)),
+                ('data_cache', models.DateTimeField(blank=True, null=True)),
+                ('data_criacao', models.DateTimeField(auto_now_add=True)),
+                ('data_atualizacao', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='campanha',
+            name='segmentos',
+            field=models.ManyToManyField(blank=True, related_name='campanhas', to='marketing.segmento'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.4 on 2026-10-18 12:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketing', '0011_segmento'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='email',
+            index=models.Index(fields=['campanha', 'status', 'reservado_ate'], name='email_reserva_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.4 on 2026-10-18 11:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketing', '0012_email_reserva_idx'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='campanha',
+            name='status',
+            field=models.CharField(choices=[('rascunho', 'Rascunho'), ('agendada', 'Agendada'), ('enviando', 'Enviando'), ('concluida', 'Concluída'), ('cancelada', 'Cancelada'), ('falha', 'Falha')], default='rascunho', max_length=20),
+        ),
+    ]
@@ -1,4 +1,7 @@
-from django.db import models
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import Count, F, FloatField, Q
+from django.db.models.functions import Cast, Coalesce, NullIf
 from django.utils import timezone
 from django.contrib.auth.models import User
 import uuid
@@ -21,6 +24,36 @@ class GrupoCliente(models.Model):
     def __str__(self):
         return self.nome
 
+class Segmento(models.Model):
+    """Público dinâmico definido por regras sobre os clientes (ver segmentos.compilar_regras)"""
+    CAMPOS_CACHE = ('versao', 'versao_cache', 'total_cache', 'data_cache')
+    
+    nome = models.CharField(max_length=100)
+    descricao = models.TextField(blank=True)
+    regras = models.JSONField(default=dict, blank=True)
+    # Incrementada a cada escrita em clientes ou nas regras; o total em cache só vale para a mesma versão
+    versao = models.BigIntegerField(default=0)
+    versao_cache = models.BigIntegerField(null=True, blank=True)
+    total_cache = models.IntegerField(null=True, blank=True)
+    data_cache = models.DateTimeField(null=True, blank=True)
+    data_criacao = models.DateTimeField(auto_now_add=True)
+    data_atualizacao = models.DateTimeField(auto_now=True)
+    
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            # Os campos do cache são mantidos só por UPDATEs condicionais, nunca sobrescritos pelo save
+            kwargs['update_fields'] = [
+                campo.name for campo in self._meta.concrete_fields
+                if not campo.primary_key and campo.name not in self.CAMPOS_CACHE
+            ]
+        super().save(*args, **kwargs)
+        # Regras possivelmente alteradas: invalidar o total em cache e as contagens em andamento
+        Segmento.objects.filter(pk=self.pk).update(versao=models.F('versao') + 1, versao_cache=None, total_cache=None)
+        self.refresh_from_db(fields=self.CAMPOS_CACHE)
+    
+    def __str__(self):
+        return self.nome
+
 class Campanha(models.Model):
     STATUS_CHOICES = [
         ('rascunho', 'Rascunho'),
@@ -28,6 +61,7 @@ class Campanha(models.Model):
         ('enviando', 'Enviando'),
         ('concluida', 'Concluída'),
         ('cancelada', 'Cancelada'),
+        ('falha', 'Falha'),
     ]
     
     titulo = models.CharField(max_length=200)
@@ -37,12 +71,23 @@ class Campanha(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='rascunho')
     criador = models.ForeignKey(User, on_delete=models.CASCADE, related_name='campanhas')
     grupos = models.ManyToManyField(GrupoCliente, blank=True, related_name='campanhas')
+    segmentos = models.ManyToManyField(Segmento, blank=True, related_name='campanhas')
     todos_clientes = models.BooleanField(default=False)
     data_criacao = models.DateTimeField(auto_now_add=True)
     data_atualizacao = models.DateTimeField(auto_now=True)
     data_agendamento = models.DateTimeField(null=True, blank=True)
     data_inicio_envio = models.DateTimeField(null=True, blank=True)
     data_fim_envio = models.DateTimeField(null=True, blank=True)
+    # URLs rastreadas do corpo; o id de cada link é a posição na lista + 1
+    links = models.JSONField(default=list, blank=True, editable=False)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'data_agendamento'], name='campanha_status_agenda_idx'),
+            # Índice parcial só com as campanhas que aguardam o agendador
+            models.Index(fields=['data_agendamento'], condition=models.Q(status='agendada'),
+                         name='campanha_agendada_idx'),
+        ]
     
     def __str__(self):
         return self.titulo
@@ -59,6 +104,7 @@ class Anexo(models.Model):
 class Email(models.Model):
     STATUS_CHOICES = [
         ('aguardando', 'Aguardando Envio'),
+        ('enviando', 'Enviando'),
         ('enviado', 'Enviado'),
         ('falha', 'Falha no Envio'),
         ('aberto', 'Aberto'),
@@ -74,29 +120,86 @@ class Email(models.Model):
     data_abertura = models.DateTimeField(null=True, blank=True)
     data_clique = models.DateTimeField(null=True, blank=True)
     data_resposta = models.DateTimeField(null=True, blank=True)
+    # Reserva do email por um processo de envio; reservas vencidas podem ser retomadas por outro
+    reservado_por = models.CharField(max_length=100, blank=True)
+    reservado_ate = models.DateTimeField(null=True, blank=True)
+    # Tentativas de envio; falhas transitórias voltam para 'aguardando' com a próxima tentativa agendada
+    tentativas = models.PositiveIntegerField(default=0)
+    proxima_tentativa = models.DateTimeField(null=True, blank=True)
+    motivo_falha = models.TextField(blank=True)
+    
+    # Ordem de progresso dos status; eventos de rastreamento nunca fazem um email regredir
+    NIVEL_STATUS = {
+        'aguardando': 0,
+        'enviando': 0,
+        'falha': 0,
+        'enviado': 1,
+        'aberto': 2,
+        'clicado': 3,
+        'respondido': 4,
+    }
+    
+    CAMPO_DATA_STATUS = {
+        'enviado': 'data_envio',
+        'aberto': 'data_abertura',
+        'clicado': 'data_clique',
+        'respondido': 'data_resposta',
+    }
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['campanha', 'cliente'], name='unique_email_campanha_cliente'),
+        ]
+        indexes = [
+            models.Index(fields=['campanha', 'status'], name='email_campanha_status_idx'),
+            models.Index(fields=['campanha', 'data_envio'], name='email_campanha_envio_idx'),
+            # Índice parcial com apenas os emails ainda não enviados, a fila do envio
+            models.Index(fields=['campanha'], condition=models.Q(status='aguardando'),
+                         name='email_aguardando_idx'),
+            # Reservas vencidas, retomadas por outro worker
+            models.Index(fields=['campanha', 'status', 'reservado_ate'], name='email_reserva_idx'),
+        ]
     
     def __str__(self):
         return f"Email para {self.cliente.email} - Campanha: {self.campanha.titulo}"
     
+    def _alterar_status(self, status, campo_data):
+        status_anterior = self.status
+        self.status = status
+        setattr(self, campo_data, timezone.now())
+        if not Relatorio.incremental():
+            self.save()
+            return
+        with transaction.atomic():
+            self.save()
+            Relatorio.registrar_transicao(self.campanha_id, status_anterior, status)
+    
+    def aplicar_evento(self, status, quando):
+        """
+        Registra um evento de rastreamento sem regredir o status.
+        Apenas a primeira ocorrência de cada evento guarda a data. Retorna True se algo mudou.
+        """
+        alterado = False
+        campo_data = self.CAMPO_DATA_STATUS[status]
+        if getattr(self, campo_data) is None:
+            setattr(self, campo_data, quando)
+            alterado = True
+        if self.NIVEL_STATUS[self.status] < self.NIVEL_STATUS[status]:
+            self.status = status
+            alterado = True
+        return alterado
+    
     def marcar_como_enviado(self):
-        self.status = 'enviado'
-        self.data_envio = timezone.now()
-        self.save()
+        self._alterar_status('enviado', 'data_envio')
     
     def marcar_como_aberto(self):
-        self.status = 'aberto'
-        self.data_abertura = timezone.now()
-        self.save()
+        self._alterar_status('aberto', 'data_abertura')
     
     def marcar_como_clicado(self):
-        self.status = 'clicado'
-        self.data_clique = timezone.now()
-        self.save()
+        self._alterar_status('clicado', 'data_clique')
     
     def marcar_como_respondido(self):
-        self.status = 'respondido'
-        self.data_resposta = timezone.now()
-        self.save()
+        self._alterar_status('respondido', 'data_resposta')
 
 class Relatorio(models.Model):
     campanha = models.OneToOneField(Campanha, on_delete=models.CASCADE, related_name='relatorio')
@@ -109,23 +212,126 @@ class Relatorio(models.Model):
     taxa_resposta = models.FloatField(default=0)
     data_geracao = models.DateTimeField(auto_now=True)
     
+    # Status de email contabilizados em cada métrica
+    STATUS_ABERTURA = ['aberto', 'clicado', 'respondido']
+    STATUS_CLIQUE = ['clicado', 'respondido']
+    STATUS_RESPOSTA = ['respondido']
+    
     def __str__(self):
         return f"Relatório: {self.campanha.titulo}"
     
-    def atualizar_metricas(self):
-        emails = self.campanha.emails.all()
-        total = emails.count()
+    @staticmethod
+    def incremental():
+        """No modo incremental os contadores são mantidos pelas transições de status dos emails"""
+        return getattr(settings, 'MARKETING_RELATORIO_INCREMENTAL', False)
+    
+    @classmethod
+    def obter_para(cls, campanha):
+        """Retorna o relatório da campanha, criando-o com os totais atuais se necessário"""
+        relatorio, created = cls.objects.get_or_create(campanha=campanha)
+        if created and cls.incremental():
+            relatorio.recontar_metricas()
+        return relatorio
+    
+    @classmethod
+    def incrementar(cls, campanha_id, envios=0, aberturas=0, cliques=0, respostas=0):
+        """Soma os deltas aos contadores e recalcula as taxas em um único UPDATE atômico"""
+        if not cls.incremental() or not any((envios, aberturas, cliques, respostas)):
+            return
+        
+        total = NullIf(Cast(F('total_envios') + envios, FloatField()), 0.0)
+        taxa = lambda campo, delta: Coalesce(Cast(F(campo) + delta, FloatField()) * 100.0 / total, 0.0)
+        
+        cls.objects.filter(campanha_id=campanha_id).update(
+            total_envios=F('total_envios') + envios,
+            total_aberturas=F('total_aberturas') + aberturas,
+            total_cliques=F('total_cliques') + cliques,
+            total_respostas=F('total_respostas') + respostas,
+            taxa_abertura=taxa('total_aberturas', aberturas),
+            taxa_clique=taxa('total_cliques', cliques),
+            taxa_resposta=taxa('total_respostas', respostas),
+            data_geracao=timezone.now()
+        )
+    
+    @classmethod
+    def registrar_transicao(cls, campanha_id, status_anterior, status_novo, quantidade=1):
+        """Atualiza os contadores para emails que passaram de `status_anterior` para `status_novo`"""
+        delta = lambda grupo: ((status_novo in grupo) - (status_anterior in grupo)) * quantidade
+        cls.incrementar(
+            campanha_id,
+            aberturas=delta(cls.STATUS_ABERTURA),
+            cliques=delta(cls.STATUS_CLIQUE),
+            respostas=delta(cls.STATUS_RESPOSTA)
+        )
+    
+    def recontar_metricas(self):
+        """Recalcula todas as métricas a partir dos emails da campanha em uma única consulta"""
+        totais = self.campanha.emails.aggregate(
+            total=Count('id'),
+            aberturas=Count('id', filter=Q(status__in=self.STATUS_ABERTURA)),
+            cliques=Count('id', filter=Q(status__in=self.STATUS_CLIQUE)),
+            respostas=Count('id', filter=Q(status__in=self.STATUS_RESPOSTA)),
+        )
+        total = totais['total']
         
         if total > 0:
-            aberturas = emails.filter(status__in=['aberto', 'clicado', 'respondido']).count()
-            cliques = emails.filter(status__in=['clicado', 'respondido']).count()
-            respostas = emails.filter(status='respondido').count()
-            
             self.total_envios = total
-            self.total_aberturas = aberturas
-            self.total_cliques = cliques
-            self.total_respostas = respostas
-            self.taxa_abertura = (aberturas / total) * 100
-            self.taxa_clique = (cliques / total) * 100
-            self.taxa_resposta = (respostas / total) * 100
+            self.total_aberturas = totais['aberturas']
+            self.total_cliques = totais['cliques']
+            self.total_respostas = totais['respostas']
+            self.taxa_abertura = (totais['aberturas'] / total) * 100
+            self.taxa_clique = (totais['cliques'] / total) * 100
+            self.taxa_resposta = (totais['respostas'] / total) * 100
             self.save()
+    
+    def atualizar_metricas(self):
+        if self.incremental():
+            # Os contadores já estão em dia; apenas recarregar os valores do banco
+            self.refresh_from_db()
+            return
+        self.recontar_metricas()
+
+class Importacao(models.Model):
+    STATUS_CHOICES = [
+        ('pendente', 'Pendente'),
+        ('processando', 'Processando'),
+        ('concluida', 'Concluída'),
+        ('falha', 'Falha'),
+    ]
+    
+    arquivo = models.FileField(upload_to='importacoes/')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pendente')
+    linhas_processadas = models.IntegerField(default=0)
+    clientes_criados = models.IntegerField(default=0)
+    clientes_atualizados = models.IntegerField(default=0)
+    total_erros = models.IntegerField(default=0)
+    erros = models.JSONField(default=list, blank=True)
+    data_criacao = models.DateTimeField(auto_now_add=True)
+    data_atualizacao = models.DateTimeField(auto_now=True)
+    data_inicio = models.DateTimeField(null=True, blank=True)
+    data_fim = models.DateTimeField(null=True, blank=True)
+    
+    def __str__(self):
+        return f"Importação {self.id} ({self.get_status_display()})"
+
+class Disparo(models.Model):
+    """Criação em segundo plano dos emails de uma campanha iniciada pela API"""
+    STATUS_CHOICES = [
+        ('pendente', 'Pendente'),
+        ('processando', 'Processando'),
+        ('concluido', 'Concluído'),
+        ('falha', 'Falha'),
+    ]
+    
+    campanha = models.ForeignKey(Campanha, on_delete=models.CASCADE, related_name='disparos')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pendente')
+    clientes_processados = models.IntegerField(default=0)
+    emails_criados = models.IntegerField(default=0)
+    erro = models.TextField(blank=True)
+    data_criacao = models.DateTimeField(auto_now_add=True)
+    data_atualizacao = models.DateTimeField(auto_now=True)
+    data_inicio = models.DateTimeField(null=True, blank=True)
+    data_fim = models.DateTimeField(null=True, blank=True)
+    
+    def __str__(self):
+        return f"Disparo {self.id} da campanha {self.campanha_id} ({self.get_status_display()})"
@@ -0,0 +1,11 @@
+from rest_framework.pagination import CursorPagination
+
+class PaginacaoCursor(CursorPagination):
+    """
+    Paginação por cursor (keyset) ordenada pela chave primária: o custo de cada página
+    não depende da profundidade, ao contrário da paginação por offset.
+    """
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    ordering = '-id'
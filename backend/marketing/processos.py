@@ -0,0 +1,44 @@
+"""
+Funções executadas nos processos filhos do agendador. O módulo não importa os models
+no carregamento, pois os filhos são iniciados com 'spawn' e só configuram o Django no inicializador.
+"""
+import django
+import signal
+import time
+
+_parada = None
+
+def inicializar(parada):
+    global _parada
+    django.setup()
+    _parada = parada
+    # O processo principal coordena o encerramento; SIGTERM direto apenas pede a parada
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda *args: parada.set())
+
+def deve_parar():
+    return _parada is not None and _parada.is_set()
+
+def executar_campanha(campanha_id, disparo_id=None):
+    """
+    Cria os emails do disparo, se informado, e envia a campanha. Retorna também as métricas
+    desta execução, que o processo principal soma às suas.
+    """
+    from .disparos import processar_disparo
+    from .metricas import metricas
+    from .models import Campanha, Disparo
+    from .tasks import processar_envio_campanha
+
+    inicio = time.monotonic()
+    metricas.limpar()
+    if disparo_id is not None:
+        disparo = processar_disparo(Disparo.objects.select_related('campanha').get(id=disparo_id), deve_parar=deve_parar)
+        if disparo.status != 'concluido':
+            # Falha ou encerramento durante a criação dos emails
+            resultado = {'enviados': 0, 'falhas': 0}
+            if disparo.status == 'falha':
+                resultado['erro'] = disparo.erro
+            return campanha_id, resultado, time.monotonic() - inicio, metricas.exportar()
+    campanha = Campanha.objects.get(id=campanha_id)
+    resultado = processar_envio_campanha(campanha, deve_parar=deve_parar)
+    return campanha_id, resultado, time.monotonic() - inicio, metricas.exportar()
@@ -0,0 +1,92 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from functools import reduce
+import logging
+import operator
+import time
+
+from .metricas import metricas
+from .models import Cliente, Email, GrupoCliente, Relatorio
+from .segmentos import compilar_regras
+
+logger = logging.getLogger(__name__)
+
+def resolver_publico(campanha):
+    """Retorna os ids distintos dos clientes ativos que devem receber a campanha"""
+    clientes = Cliente.objects.filter(ativo=True)
+
+    if not campanha.todos_clientes:
+        segmentos = [compilar_regras(regras) for regras in campanha.segmentos.values_list('regras', flat=True)]
+        if not segmentos:
+            # Um único SELECT DISTINCT sobre a tabela M2M, sem percorrer os grupos em Python
+            clientes = clientes.filter(grupos__campanhas=campanha)
+        elif all(segmentos):
+            # Grupos e segmentos na mesma consulta: os grupos viram uma subconsulta na tabela M2M,
+            # para não juntar cada cliente com todos os seus grupos antes do OU
+            participacoes = GrupoCliente.clientes.through.objects.filter(grupocliente__campanhas=campanha)
+            clientes = clientes.filter(reduce(operator.or_, segmentos, Q(pk__in=participacoes.values('cliente_id'))))
+        # Um segmento sem regras inclui todos os clientes ativos
+
+    return clientes.values_list('id', flat=True).distinct().order_by('id')
+
+def _lotes(iteravel, tamanho):
+    lote = []
+    for item in iteravel:
+        lote.append(item)
+        if len(lote) >= tamanho:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+def materializar_emails(campanha, tamanho_lote=None, progresso=None, deve_parar=None):
+    """
+    Cria os registros de Email da campanha em lotes, ignorando os já existentes.
+    `progresso`, se informado, é chamado após cada lote com os clientes processados e os emails criados.
+    Se `deve_parar()` retornar True, para entre dois lotes; uma nova execução continua de onde parou.
+    """
+    tamanho_lote = tamanho_lote or getattr(settings, 'MARKETING_TAMANHO_LOTE', 1000)
+
+    inicio = time.monotonic()
+    ids_clientes = resolver_publico(campanha).iterator(chunk_size=tamanho_lote)
+
+    total_publico = 0
+    total_criados = 0
+    tempo_consulta = 0.0
+    tempo_insercao = 0.0
+
+    marca = time.monotonic()
+    for lote in _lotes(ids_clientes, tamanho_lote):
+        tempo_consulta += time.monotonic() - marca
+        total_publico += len(lote)
+
+        marca = time.monotonic()
+        with transaction.atomic():
+            existentes = set(
+                Email.objects.filter(campanha=campanha, cliente_id__in=lote).values_list('cliente_id', flat=True)
+            )
+            novos = [
+                Email(campanha=campanha, cliente_id=cliente_id, status='aguardando')
+                for cliente_id in lote if cliente_id not in existentes
+            ]
+            # A restrição única (campanha, cliente) garante que execuções concorrentes não duplicam emails
+            Email.objects.bulk_create(novos, batch_size=tamanho_lote, ignore_conflicts=True)
+            Relatorio.incrementar(campanha.id, envios=len(novos))
+            total_criados += len(novos)
+        tempo_insercao += time.monotonic() - marca
+        if progresso:
+            progresso(total_publico, total_criados)
+        if deve_parar and deve_parar():
+            break
+        marca = time.monotonic()
+    tempo_consulta += time.monotonic() - marca
+    metricas.observar('marketing_fase_segundos', tempo_consulta, fase='publico_consulta')
+    metricas.observar('marketing_fase_segundos', tempo_insercao, fase='publico_insercao')
+
+    logger.info(
+        f"Campanha {campanha.id}: público de {total_publico} clientes materializado, {total_criados} emails criados "
+        f"(consulta {tempo_consulta:.2f}s, inserção {tempo_insercao:.2f}s, "
+        f"total {time.monotonic() - inicio:.2f}s)"
+    )
+    return total_publico
@@ -0,0 +1,182 @@
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Case, F, Q, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from collections import Counter
+import atexit
+import logging
+import threading
+import uuid
+
+from .metricas import metricas
+from .models import Email, Relatorio
+
+logger = logging.getLogger(__name__)
+
+def identificador_email(valor):
+    """Converte o identificador da URL (uuid ou pk) sem consultar o banco; None se inválido"""
+    if isinstance(valor, (uuid.UUID, int)):
+        return valor
+    valor = str(valor)
+    if valor.isdigit():
+        return int(valor)
+    try:
+        return uuid.UUID(valor)
+    except ValueError:
+        return None
+
+class BufferRastreamento:
+    """
+    Acumula aberturas e cliques em memória e os grava em lote (write-behind),
+    para que as requisições do pixel não disputem o lock de escrita do banco.
+    """
+
+    def __init__(self, intervalo=None, tamanho_maximo=None):
+        self._intervalo = intervalo
+        self._tamanho_maximo = tamanho_maximo
+        self._eventos = {}  # identificador -> {status: primeira data}
+        self._lock = threading.Lock()
+        self._descarga_lock = threading.Lock()
+        self._acordar = threading.Event()
+        self._thread = None
+
+    @property
+    def intervalo(self):
+        return self._intervalo or getattr(settings, 'MARKETING_RASTREAMENTO_INTERVALO', 2.0)
+
+    @property
+    def tamanho_maximo(self):
+        return self._tamanho_maximo or getattr(settings, 'MARKETING_RASTREAMENTO_LOTE', 1000)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._eventos)
+
+    def registrar(self, status, identificador, quando=None):
+        """Enfileira um evento ('aberto' ou 'clicado') para o email; não acessa o banco"""
+        quando = quando or timezone.now()
+        with self._lock:
+            eventos = self._eventos.setdefault(identificador, {})
+            eventos.setdefault(status, quando)
+            cheio = len(self._eventos) >= self.tamanho_maximo
+
+        self._iniciar_thread()
+        if cheio:
+            self._acordar.set()
+
+    def _iniciar_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._executar, name='rastreamento', daemon=True)
+            self._thread.start()
+
+    def _executar(self):
+        while True:
+            self._acordar.wait(self.intervalo)
+            self._acordar.clear()
+            try:
+                close_old_connections()
+                self.descarregar()
+            except Exception as e:
+                logger.error(f"Erro ao gravar eventos de rastreamento: {str(e)}")
+            finally:
+                connection.close()
+
+    def descarregar(self):
+        """Grava os eventos pendentes com bulk_update; retorna quantos emails mudaram"""
+        with self._descarga_lock:
+            with self._lock:
+                eventos, self._eventos = self._eventos, {}
+            if not eventos:
+                return 0
+
+            uuids = [chave for chave in eventos if isinstance(chave, uuid.UUID)]
+            pks = [chave for chave in eventos if isinstance(chave, int)]
+            try:
+                return self._gravar(eventos, uuids, pks)
+            except Exception:
+                # Devolver os eventos ao buffer para a próxima tentativa
+                with self._lock:
+                    for chave, datas in eventos.items():
+                        atuais = self._eventos.setdefault(chave, {})
+                        for status, quando in datas.items():
+                            atuais[status] = min(quando, atuais.get(status, quando))
+                raise
+
+    def _gravar(self, eventos, uuids, pks):
+        alterados = []
+        transicoes = Counter()
+
+        with metricas.medir('rastreamento_gravacao'), transaction.atomic():
+            # Linhas travadas em ordem de id: descargas de outros processos esperam em vez de contar de novo
+            emails = Email.objects.filter(Q(uuid__in=uuids) | Q(pk__in=pks)).select_for_update().order_by('id').only(
+                'id', 'uuid', 'campanha_id', 'status', 'data_abertura', 'data_clique'
+            )
+            for email in emails:
+                datas = {}
+                for chave in (email.uuid, email.pk):
+                    for status, quando in eventos.get(chave, {}).items():
+                        datas[status] = min(quando, datas.get(status, quando))
+                if not datas:
+                    continue
+
+                status_anterior = email.status
+                alterado = False
+                for status in sorted(datas, key=Email.NIVEL_STATUS.get):
+                    alterado = email.aplicar_evento(status, datas[status]) or alterado
+                if alterado:
+                    alterados.append(email)
+                    if email.status != status_anterior:
+                        transicoes[(email.campanha_id, status_anterior, email.status)] += 1
+
+            Email.objects.bulk_update(alterados, ['status', 'data_abertura', 'data_clique'], batch_size=500)
+            for (campanha_id, status_anterior, status_novo), quantidade in transicoes.items():
+                Relatorio.registrar_transicao(campanha_id, status_anterior, status_novo, quantidade)
+
+        return len(alterados)
+
+buffer_rastreamento = BufferRastreamento()
+
+def registrar_evento(status, identificador):
+    """Registra uma abertura ou clique, em lote ou imediatamente conforme as configurações"""
+    metricas.incrementar('marketing_rastreamento_eventos_total', evento=status)
+    with metricas.medir('rastreamento', evento=status):
+        if getattr(settings, 'MARKETING_RASTREAMENTO_BUFFER', True):
+            buffer_rastreamento.registrar(status, identificador)
+        else:
+            gravar_evento(status, identificador, timezone.now())
+
+def gravar_evento(status, identificador, quando):
+    """Grava um evento com um único UPDATE das colunas de status e data, sem regredir o status"""
+    filtro = {'uuid': identificador} if isinstance(identificador, uuid.UUID) else {'pk': identificador}
+    campo_data = Email.CAMPO_DATA_STATUS[status]
+    inferiores = [s for s, nivel in Email.NIVEL_STATUS.items() if nivel < Email.NIVEL_STATUS[status]]
+
+    data = Coalesce(F(campo_data), Value(quando))
+
+    with transaction.atomic():
+        while Relatorio.incremental():
+            anterior = Email.objects.filter(**filtro).values_list('campanha_id', 'status').first()
+            if anterior is None or anterior[1] not in inferiores:
+                break
+            # Só conta a transição quem de fato mudou o status lido; se outra requisição
+            # mudou antes, o UPDATE não encontra a linha e o status é lido de novo
+            if Email.objects.filter(**filtro, status=anterior[1]).update(status=status, **{campo_data: data}):
+                Relatorio.registrar_transicao(anterior[0], anterior[1], status)
+                return
+
+        Email.objects.filter(**filtro).update(**{
+            campo_data: data,
+            'status': Case(When(status__in=inferiores, then=Value(status)), default=F('status')),
+        })
+
+@atexit.register
+def _descarregar_ao_sair():
+    try:
+        buffer_rastreamento.descarregar()
+    except Exception as e:
+        logger.error(f"Erro ao gravar eventos de rastreamento pendentes: {str(e)}")
@@ -0,0 +1,169 @@
+from django.conf import settings
+from operator import attrgetter
+import re
+
+from .links import PADRAO_LINK, registrar_links, url_clique
+from .models import Cliente
+
+PADRAO_CAMPO = re.compile(r'\{\{(\w+)\}\}')
+
+def campos_disponiveis():
+    """Campos do Cliente que podem ser usados como {{campo}} no assunto e no corpo"""
+    return {campo.attname for campo in Cliente._meta.concrete_fields}
+
+class TemplateCompilado:
+    """
+    Texto pré-dividido em trechos estáticos e lacunas, para que a personalização
+    de cada destinatário seja um único join.
+
+    As lacunas são campos do Cliente ({{nome}}, {{email}}, ...) ou valores extras
+    nomeados (ex.: o pixel de rastreamento) informados na renderização.
+    """
+
+    def __init__(self, texto, campos=None):
+        campos = campos_disponiveis() if campos is None else campos
+        self._partes = []
+        self._lacunas = []  # (índice em _partes, getter do cliente ou None, nome do extra)
+
+        posicao = 0
+        for encontrado in PADRAO_CAMPO.finditer(texto):
+            campo = encontrado.group(1)
+            if campo not in campos:
+                # Placeholders desconhecidos permanecem no texto, como antes
+                continue
+            self._partes.append(texto[posicao:encontrado.start()])
+            self._lacunas.append((len(self._partes), attrgetter(campo), None))
+            self._partes.append('')
+            posicao = encontrado.end()
+        self._partes.append(texto[posicao:])
+
+    def _estaticas(self):
+        indices = {indice for indice, _, _ in self._lacunas}
+        return [parte for indice, parte in enumerate(self._partes) if indice not in indices]
+
+    def contem(self, trecho):
+        """Indica se o trecho aparece na parte estática do template"""
+        return any(trecho in parte for parte in self._estaticas())
+
+    def prefixar(self, texto):
+        self._partes.insert(0, texto)
+        self._lacunas = [(indice + 1, getter, extra) for indice, getter, extra in self._lacunas]
+
+    def acrescentar(self, texto='', extra=None):
+        """Acrescenta um trecho estático ou, com `extra`, uma lacuna nomeada ao final"""
+        if extra:
+            self._lacunas.append((len(self._partes), None, extra))
+        self._partes.append(texto)
+
+    def substituir(self, padrao, extra):
+        """
+        Troca o grupo 'valor' de cada ocorrência estática de `padrao` pela lacuna nomeada
+        retornada por `extra(encontrado)`; ocorrências para as quais ela retorna None ficam como estão
+        """
+        lacunas = {indice: (getter, nome) for indice, getter, nome in self._lacunas}
+        partes = []
+        novas_lacunas = []
+
+        for indice, parte in enumerate(self._partes):
+            if indice in lacunas:
+                novas_lacunas.append((len(partes),) + lacunas[indice])
+                partes.append(parte)
+                continue
+            posicao = 0
+            for encontrado in padrao.finditer(parte):
+                nome = extra(encontrado)
+                if nome is None:
+                    continue
+                inicio, fim = encontrado.span('valor')
+                partes.append(parte[posicao:inicio])
+                novas_lacunas.append((len(partes), None, nome))
+                partes.append('')
+                posicao = fim
+            partes.append(parte[posicao:])
+
+        self._partes = partes
+        self._lacunas = novas_lacunas
+
+    def inserir_antes(self, marcador, extra):
+        """Insere a lacuna nomeada `extra` antes de cada ocorrência estática de `marcador`"""
+        lacunas = {indice: (getter, nome) for indice, getter, nome in self._lacunas}
+        partes = []
+        novas_lacunas = []
+
+        for indice, parte in enumerate(self._partes):
+            if indice in lacunas:
+                novas_lacunas.append((len(partes),) + lacunas[indice])
+                partes.append(parte)
+                continue
+            pedacos = parte.split(marcador)
+            for pedaco in pedacos[:-1]:
+                partes.append(pedaco)
+                novas_lacunas.append((len(partes), None, extra))
+                partes.append('')
+                partes.append(marcador)
+            partes.append(pedacos[-1])
+
+        self._partes = partes
+        self._lacunas = novas_lacunas
+
+    def renderizar(self, cliente, **extras):
+        partes = self._partes[:]
+        for indice, getter, extra in self._lacunas:
+            if getter is None:
+                partes[indice] = extras[extra]
+            else:
+                valor = getter(cliente)
+                partes[indice] = '' if valor is None else str(valor)
+        return ''.join(partes)
+
+class CampanhaCompilada:
+    """
+    Assunto, corpo texto e corpo HTML compilados uma vez por campanha. No HTML entram o pixel
+    de rastreamento e, no lugar de cada link, a URL de clique assinada do destinatário.
+    """
+
+    def __init__(self, campanha):
+        campos = campos_disponiveis()
+        self.campanha = campanha
+        self.assunto = TemplateCompilado(campanha.assunto, campos)
+        self.texto = TemplateCompilado(campanha.corpo, campos)
+        self.html = TemplateCompilado(campanha.corpo, campos)
+
+        self.links = {}
+        if getattr(settings, 'MARKETING_RASTREAR_CLIQUES', True):
+            self.links = registrar_links(campanha)
+            self.html.substituir(PADRAO_LINK, self._lacuna_link)
+
+        # Adicionar versão HTML com pixel de rastreamento
+        if self.html.contem("<html"):
+            if self.html.contem("</body>"):
+                # Adicionar o pixel antes do </body>
+                self.html.inserir_antes("</body>", 'pixel')
+            else:
+                self.html.acrescentar(extra='pixel')
+        else:
+            # Email de texto simples, converter para HTML simples
+            self.html.prefixar("<html><body>")
+            self.html.acrescentar(extra='pixel')
+            self.html.acrescentar("</body></html>")
+
+    def _lacuna_link(self, encontrado):
+        link_id = self.links.get(encontrado.group('valor'))
+        return f"link:{link_id}" if link_id else None
+
+    def renderizar(self, email_obj, cliente=None):
+        """Retorna (assunto, corpo texto, corpo HTML) personalizados para o email"""
+        cliente = cliente or email_obj.cliente
+        extras = {
+            'pixel': f"<img src='{settings.BASE_URL}/api/emails/{email_obj.uuid}/rastreamento/' width='1' height='1' />"
+        }
+        for escrito, link_id in self.links.items():
+            # Sem id (email não salvo, ex.: benchmarks) não há como rastrear: manter o link original
+            extras[f'link:{link_id}'] = (
+                url_clique(self.campanha.id, email_obj.pk, link_id) if email_obj.pk and self.campanha.id else escrito
+            )
+        return (
+            self.assunto.renderizar(cliente),
+            self.texto.renderizar(cliente),
+            self.html.renderizar(cliente, **extras),
+        )
@@ -0,0 +1,100 @@
+from django.conf import settings
+from django.utils import timezone
+from datetime import timedelta
+import logging
+import random
+import smtplib
+import threading
+
+logger = logging.getLogger(__name__)
+
+def dominio_email(endereco):
+    return endereco.rsplit('@', 1)[-1].lower()
+
+def _codigos_smtp(erro):
+    """Códigos de resposta SMTP contidos no erro (smtplib ou aiosmtplib)"""
+    codigo = getattr(erro, 'smtp_code', None) or getattr(erro, 'code', None)
+    if isinstance(codigo, int):
+        return [codigo]
+    destinatarios = getattr(erro, 'recipients', None)
+    if isinstance(destinatarios, dict):
+        # smtplib.SMTPRecipientsRefused: {endereço: (código, mensagem)}
+        return [resposta[0] for resposta in destinatarios.values()]
+    if isinstance(destinatarios, list):
+        # aiosmtplib.SMTPRecipientsRefused: lista de SMTPRecipientRefused
+        return [getattr(recusa, 'code', None) for recusa in destinatarios if isinstance(getattr(recusa, 'code', None), int)]
+    return []
+
+def erro_transitorio(erro):
+    """
+    Indica se vale a pena tentar o envio novamente: respostas SMTP 4xx e falhas de conexão.
+    Respostas 5xx e erros desconhecidos (ex.: anexo ausente) são permanentes.
+    """
+    codigos = _codigos_smtp(erro)
+    if codigos:
+        return all(400 <= codigo < 500 for codigo in codigos)
+    return isinstance(erro, (ConnectionError, TimeoutError, smtplib.SMTPServerDisconnected))
+
+def calcular_espera(tentativas):
+    """Backoff exponencial com jitter: metade fixa e metade aleatória do intervalo da tentativa"""
+    base = getattr(settings, 'MARKETING_BACKOFF_BASE', 60)
+    maximo = getattr(settings, 'MARKETING_BACKOFF_MAXIMO', 3600)
+    intervalo = min(maximo, base * 2 ** max(0, tentativas - 1))
+    return timedelta(seconds=intervalo / 2 + random.uniform(0, intervalo / 2))
+
+class DisjuntorDominios:
+    """
+    Circuit breaker por domínio de destino. Após `limite_falhas` falhas transitórias seguidas
+    o domínio fica bloqueado por `pausa` segundos e os emails para ele são adiados. Vencida a pausa,
+    uma mensagem é liberada como teste: sucesso fecha o disjuntor, nova falha o reabre.
+    """
+
+    def __init__(self, limite_falhas=None, pausa=None):
+        self._limite_falhas = limite_falhas
+        self._pausa = pausa
+        self._estados = {}
+        self._lock = threading.Lock()
+
+    @property
+    def limite_falhas(self):
+        if self._limite_falhas is not None:
+            return self._limite_falhas
+        return getattr(settings, 'MARKETING_DISJUNTOR_FALHAS', 5)
+
+    @property
+    def pausa(self):
+        segundos = self._pausa if self._pausa is not None else getattr(settings, 'MARKETING_DISJUNTOR_SEGUNDOS', 300)
+        return timedelta(seconds=segundos)
+
+    def bloqueado_ate(self, dominio):
+        """Retorna até quando o domínio está bloqueado, ou None se o envio pode prosseguir"""
+        with self._lock:
+            estado = self._estados.get(dominio)
+            if estado is None or estado['aberto_ate'] is None:
+                return None
+            agora = timezone.now()
+            if agora < estado['aberto_ate']:
+                return estado['aberto_ate']
+            # Pausa vencida: liberar esta mensagem como teste e manter as demais bloqueadas até o resultado
+            estado['aberto_ate'] = agora + self.pausa
+            return None
+
+    def registrar(self, dominio, erro=None):
+        """Atualiza o estado do domínio com o resultado de um envio"""
+        with self._lock:
+            if erro is None or not erro_transitorio(erro):
+                # O servidor respondeu normalmente (mesmo que recusando o destinatário)
+                self._estados.pop(dominio, None)
+                return
+            estado = self._estados.setdefault(dominio, {'falhas': 0, 'aberto_ate': None})
+            estado['falhas'] += 1
+            if estado['falhas'] >= self.limite_falhas:
+                if estado['aberto_ate'] is None:
+                    logger.warning(f"Envios para {dominio} suspensos após {estado['falhas']} falhas transitórias seguidas")
+                estado['aberto_ate'] = timezone.now() + self.pausa
+
+    def limpar(self):
+        with self._lock:
+            self._estados.clear()
+
+disjuntor_dominios = DisjuntorDominios()
@@ -0,0 +1,182 @@
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from datetime import datetime, time
+from functools import partial, reduce
+import operator
+import threading
+
+from .models import Cliente, GrupoCliente, Segmento
+
+# Operadores das regras e os lookups correspondentes; 'diferente' e 'fora' são as negações de 'igual' e 'em'
+LOOKUPS = {
+    'igual': 'exact',
+    'em': 'in',
+    'maior': 'gt',
+    'maior_igual': 'gte',
+    'menor': 'lt',
+    'menor_igual': 'lte',
+    'entre': 'range',
+    'contem': 'icontains',
+    'comeca_com': 'istartswith',
+    'termina_com': 'iendswith',
+}
+NEGACOES = {'diferente': 'igual', 'fora': 'em'}
+
+OPERADORES_TEXTO = {'igual', 'diferente', 'em', 'fora', 'contem', 'comeca_com', 'termina_com'}
+OPERADORES_CAMPO = {
+    'nome': OPERADORES_TEXTO,
+    'sobrenome': OPERADORES_TEXTO,
+    'email': OPERADORES_TEXTO,
+    'ativo': {'igual', 'diferente'},
+    'data_cadastro': {'igual', 'maior', 'maior_igual', 'menor', 'menor_igual', 'entre'},
+    # Campos derivados: domínio do email e participação em grupos
+    'dominio': {'igual', 'diferente', 'em', 'fora'},
+    'grupo': {'em', 'fora'},
+}
+
+def _data(valor, fim_do_dia=False):
+    """Data ou data/hora ISO 8601; datas sem horário cobrem o dia inteiro nos limites superiores"""
+    try:
+        dia = parse_date(valor) if isinstance(valor, str) else None
+        data = parse_datetime(valor) if isinstance(valor, str) and dia is None else None
+    except ValueError:
+        dia = data = None
+    if dia is not None:
+        data = datetime.combine(dia, time.max if fim_do_dia else time.min)
+    if data is None:
+        raise ValidationError(f"Data inválida: {valor!r}")
+    if timezone.is_naive(data):
+        data = timezone.make_aware(data)
+    return data
+
+def _lista(valor, operador):
+    if operador in ('em', 'fora'):
+        if not isinstance(valor, list) or not valor:
+            raise ValidationError(f"O operador {operador!r} requer uma lista não vazia")
+        return valor
+    return [valor]
+
+def _predicado(campo, operador, valor):
+    if campo not in OPERADORES_CAMPO:
+        raise ValidationError(f"Campo desconhecido: {campo!r}")
+    if operador not in OPERADORES_CAMPO[campo]:
+        raise ValidationError(f"Operador {operador!r} não suportado para {campo!r}")
+    positivo = NEGACOES.get(operador, operador)
+
+    if campo == 'dominio':
+        # O índice único do email não ajuda aqui, mas continua sendo uma única condição na consulta
+        condicoes = []
+        for dominio in _lista(valor, operador):
+            if not isinstance(dominio, str) or not dominio.strip('@ '):
+                raise ValidationError(f"Domínio inválido: {dominio!r}")
+            condicoes.append(Q(email__iendswith='@' + dominio.strip('@ ').lower()))
+        q = reduce(operator.or_, condicoes)
+    elif campo == 'grupo':
+        try:
+            ids = [int(grupo) for grupo in _lista(valor, operador)]
+        except (TypeError, ValueError):
+            raise ValidationError(f"Ids de grupo inválidos: {valor!r}")
+        # Subconsulta na tabela M2M: sem JOIN, um cliente em vários grupos não se repete
+        participacoes = GrupoCliente.clientes.through.objects.filter(grupocliente_id__in=ids)
+        q = Q(pk__in=participacoes.values('cliente_id'))
+    elif campo == 'ativo':
+        if not isinstance(valor, bool):
+            raise ValidationError('O campo ativo requer true ou false')
+        q = Q(ativo=valor)
+    elif campo == 'data_cadastro':
+        if positivo == 'entre':
+            if not isinstance(valor, list) or len(valor) != 2:
+                raise ValidationError("O operador 'entre' requer uma lista [início, fim]")
+            valor = (_data(valor[0]), _data(valor[1], fim_do_dia=True))
+        elif positivo == 'igual':
+            # Igualdade de datas compara o dia inteiro
+            return Q(data_cadastro__range=(_data(valor), _data(valor, fim_do_dia=True)))
+        else:
+            valor = _data(valor, fim_do_dia=positivo in ('maior', 'menor_igual'))
+        q = Q(**{f'data_cadastro__{LOOKUPS[positivo]}': valor})
+    else:
+        if positivo == 'em':
+            if not all(isinstance(item, str) for item in _lista(valor, operador)):
+                raise ValidationError(f"O campo {campo!r} requer textos")
+        elif not isinstance(valor, str):
+            raise ValidationError(f"O campo {campo!r} requer um texto")
+        q = Q(**{f'{campo}__{LOOKUPS[positivo]}': valor})
+
+    return ~q if operador in NEGACOES else q
+
+def compilar_regras(regras):
+    """
+    Converte as regras de um segmento em um Q sobre Cliente. Formato:
+
+        {"todas": [regra, ...]}     todas as regras (E)
+        {"qualquer": [regra, ...]}  ao menos uma regra (OU)
+        {"nao": regra}              negação
+        {"campo": "dominio", "operador": "em", "valor": ["gmail.com"]}
+
+    Regras vazias ({}) selecionam todos os clientes. Erros de formato levantam ValidationError.
+    """
+    if not isinstance(regras, dict):
+        raise ValidationError('Cada regra deve ser um objeto')
+    if not regras:
+        return Q()
+    if 'todas' in regras or 'qualquer' in regras:
+        chave = 'todas' if 'todas' in regras else 'qualquer'
+        if len(regras) != 1 or not isinstance(regras[chave], list):
+            raise ValidationError(f"'{chave}' requer uma lista de regras e nenhuma outra chave")
+        if chave == 'qualquer' and not regras[chave]:
+            return Q(pk__in=[])
+        q = Q()
+        for regra in regras[chave]:
+            q = q & compilar_regras(regra) if chave == 'todas' else q | compilar_regras(regra)
+        return q
+    if 'nao' in regras:
+        if len(regras) != 1:
+            raise ValidationError("'nao' não pode ser combinado com outras chaves")
+        interna = compilar_regras(regras['nao'])
+        # O Django descarta um ~Q() vazio; a negação de "todos os clientes" é nenhum
+        return ~interna if interna else Q(pk__in=[])
+    if set(regras) != {'campo', 'operador', 'valor'}:
+        raise ValidationError("Predicados requerem exatamente as chaves 'campo', 'operador' e 'valor'")
+    return _predicado(regras['campo'], regras['operador'], regras['valor'])
+
+def clientes_do_segmento(regras):
+    """Queryset dos clientes que satisfazem as regras, resolvido em uma única consulta"""
+    return Cliente.objects.filter(compilar_regras(regras))
+
+def contar_segmento(segmento):
+    """
+    Retorna (total, do_cache). O total em cache vale enquanto a versão do segmento não mudar;
+    a gravação condicional descarta contagens que terminaram depois de uma escrita em clientes.
+    """
+    if segmento.total_cache is not None and segmento.versao_cache == segmento.versao:
+        return segmento.total_cache, True
+
+    total = clientes_do_segmento(segmento.regras).count()
+    Segmento.objects.filter(id=segmento.id, versao=segmento.versao).update(
+        total_cache=total, versao_cache=segmento.versao, data_cache=timezone.now()
+    )
+    return total, False
+
+# Invalidação pendente desta thread: as escritas de uma mesma transação compartilham o token
+_invalidacao = threading.local()
+
+def _incrementar_versoes(token):
+    # Os callbacks de uma transação rodam em sequência no commit; só o primeiro faz o UPDATE.
+    # Os de uma transação desfeita nunca rodam e o token segue pendente para a próxima escrita
+    if getattr(_invalidacao, 'token', None) is not token:
+        return
+    _invalidacao.token = None
+    Segmento.objects.update(versao=F('versao') + 1)
+
+def invalidar_segmentos(**kwargs):
+    """
+    Invalida o cache de todos os segmentos; conectado às escritas em clientes e grupos.
+    A versão é incrementada depois do commit e uma única vez por transação, por mais escritas que ela tenha.
+    """
+    token = getattr(_invalidacao, 'token', None)
+    if token is None:
+        token = _invalidacao.token = object()
+    transaction.on_commit(partial(_incrementar_versoes, token))
@@ -1,6 +1,8 @@
 from rest_framework import serializers
-from .models import Cliente, GrupoCliente, Campanha, Anexo, Email, Relatorio
+from .models import Cliente, GrupoCliente, Segmento, Campanha, Anexo, Email, Relatorio, Importacao, Disparo
+from .segmentos import compilar_regras
 from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -12,6 +14,20 @@ class ClienteSerializer(serializers.ModelSerializer):
         model = Cliente
         fields = '__all__'
 
+class ImportacaoSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Importacao
+        fields = '__all__'
+        read_only_fields = ['status', 'linhas_processadas', 'clientes_criados', 'clientes_atualizados',
+                            'total_erros', 'erros', 'data_inicio', 'data_fim']
+
+class DisparoSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Disparo
+        fields = '__all__'
+        read_only_fields = ['campanha', 'status', 'clientes_processados', 'emails_criados', 'erro',
+                            'data_inicio', 'data_fim']
+
 class GrupoClienteSerializer(serializers.ModelSerializer):
     clientes_count = serializers.SerializerMethodField()
     
@@ -20,8 +36,25 @@ class GrupoClienteSerializer(serializers.ModelSerializer):
         fields = '__all__'
     
     def get_clientes_count(self, obj):
+        # Usa a contagem anotada pelo queryset da view quando disponível
+        if hasattr(obj, 'clientes_count'):
+            return obj.clientes_count
         return obj.clientes.count()
 
+class SegmentoSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Segmento
+        fields = '__all__'
+        read_only_fields = ['versao', 'versao_cache', 'total_cache', 'data_cache']
+
+    def validate_regras(self, regras):
+        # Regras inválidas são recusadas ao salvar, não no envio da campanha
+        try:
+            compilar_regras(regras)
+        except ValidationError as e:
+            raise serializers.ValidationError(e.messages)
+        return regras
+
 class AnexoSerializer(serializers.ModelSerializer):
     class Meta:
         model = Anexo
@@ -33,7 +66,8 @@ class EmailSerializer(serializers.ModelSerializer):
     class Meta:
         model = Email
         fields = ['id', 'uuid', 'campanha', 'cliente', 'cliente_email', 'status', 
-                  'data_envio', 'data_abertura', 'data_clique', 'data_resposta']
+                  'data_envio', 'data_abertura', 'data_clique', 'data_resposta',
+                  'tentativas', 'proxima_tentativa', 'motivo_falha']
 
 class RelatorioSerializer(serializers.ModelSerializer):
     campanha_titulo = serializers.ReadOnlyField(source='campanha.titulo')
@@ -64,5 +98,5 @@ class CampanhaDetailSerializer(serializers.ModelSerializer):
     
     def get_emails(self, obj):
         # Retorna apenas um resumo dos emails para não sobrecarregar a resposta
-        emails = obj.emails.all()[:10]  # Limita a 10 emails
+        emails = obj.emails.select_related('cliente')[:10]  # Limita a 10 emails
         return EmailSerializer(emails, many=True).data 
\ No newline at end of file
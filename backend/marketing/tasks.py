@@ -5,7 +5,14 @@ from django.conf import settings
 import logging
 import time
 
-from .models import Campanha, Email, Cliente, Relatorio
+from .models import Campanha, Relatorio
+from .anexos import cache_anexos
+from .envio import EnvioAdiado, criar_despachante
+from .fila import GravadorResultados, identificador_worker, possui_pendentes, reservar_lote
+from .metricas import metricas
+from .publico import materializar_emails
+from .renderizacao import CampanhaCompilada
+from .retentativas import disjuntor_dominios, dominio_email
 
 logger = logging.getLogger(__name__)
 
@@ -16,56 +23,65 @@ def substituir_campos_dinamicos(texto, cliente):
     texto = texto.replace('{{email}}', cliente.email)
     return texto
 
+def montar_email(email_obj, compilada=None, anexos=None):
+    """Monta a mensagem personalizada de um email, sem enviá-la"""
+    campanha = email_obj.campanha
+    cliente = email_obj.cliente
+    
+    # Personalizar assunto e corpo a partir do template compilado da campanha
+    compilada = compilada or CampanhaCompilada(campanha)
+    assunto, corpo, corpo_html = compilada.renderizar(email_obj, cliente)
+    
+    # Criar email
+    email = EmailMultiAlternatives(
+        subject=assunto,
+        body=corpo,
+        from_email=settings.EMAIL_HOST_USER,
+        to=[cliente.email]
+    )
+    
+    # Adicionar versão HTML com pixel de rastreamento
+    email.attach_alternative(corpo_html, "text/html")
+    
+    # Adicionar anexos, lidos e codificados uma única vez por campanha
+    if anexos is None:
+        anexos = cache_anexos.partes_da_campanha(campanha)
+    for parte in anexos:
+        email.attach(parte)
+    
+    return email
+
+def registrar_resultado_envio(email_obj, erro=None):
+    """Atualiza o status do email de acordo com o resultado do envio e libera sua reserva"""
+    email_obj.reservado_por = ''
+    email_obj.reservado_ate = None
+    if erro is None:
+        email_obj.marcar_como_enviado()
+        return True
+    
+    logger.error(f"Erro ao enviar email para {email_obj.cliente.email}: {str(erro)}")
+    email_obj.status = 'falha'
+    email_obj.motivo_falha = str(erro)
+    email_obj.save()
+    return False
+
 def enviar_email_para_cliente(email_obj):
     """Envia um email para um cliente específico"""
     try:
-        campanha = email_obj.campanha
-        cliente = email_obj.cliente
-        
-        # Personalizar assunto e corpo
-        assunto = substituir_campos_dinamicos(campanha.assunto, cliente)
-        corpo = substituir_campos_dinamicos(campanha.corpo, cliente)
-        
-        # Adicionar imagem de rastreamento
-        pixel_rastreamento = f"<img src='{settings.BASE_URL}/api/emails/{email_obj.uuid}/rastreamento/' width='1' height='1' />"
-        
-        # Criar email
-        email = EmailMultiAlternatives(
-            subject=assunto,
-            body=corpo,
-            from_email=settings.EMAIL_HOST_USER,
-            to=[cliente.email]
-        )
-        
-        # Adicionar versão HTML com pixel de rastreamento
-        if "<html" in corpo:
-            # Adicionar o pixel antes do </body>
-            if "</body>" in corpo:
-                corpo = corpo.replace("</body>", f"{pixel_rastreamento}</body>")
-            else:
-                corpo = f"{corpo}{pixel_rastreamento}"
-        else:
-            # Email de texto simples, converter para HTML simples
-            corpo = f"<html><body>{corpo}{pixel_rastreamento}</body></html>"
-        
-        email.attach_alternative(corpo, "text/html")
-        
-        # Adicionar anexos
-        anexos = campanha.anexos.all()
-        for anexo in anexos:
-            email.attach_file(anexo.arquivo.path)
+        email = montar_email(email_obj)
         
         # Enviar email
         email.send()
-        
-        # Atualizar status do email
-        email_obj.marcar_como_enviado()
-        return True
     except Exception as e:
-        logger.error(f"Erro ao enviar email para {cliente.email}: {str(e)}")
-        email_obj.status = 'falha'
-        email_obj.save()
-        return False
+        return registrar_resultado_envio(email_obj, e)
+    
+    # Atualizar status do email
+    return registrar_resultado_envio(email_obj)
+
+def preparar_campanha(campanha):
+    """Cria o relatório, se não existir, e os emails do público da campanha"""
+    Relatorio.obter_para(campanha)
+    materializar_emails(campanha)
 
 def processar_campanhas_agendadas():
     """Verifica e processa campanhas agendadas"""
@@ -84,30 +100,8 @@ def processar_campanhas_agendadas():
             campanha.data_inicio_envio = agora
             campanha.save()
             
-            # Criar relatório se não existir
-            relatorio, _ = Relatorio.objects.get_or_create(campanha=campanha)
-            
-            # Identificar todos os clientes que devem receber
-            clientes = []
-            
-            if campanha.todos_clientes:
-                clientes = Cliente.objects.filter(ativo=True)
-            else:
-                for grupo in campanha.grupos.all():
-                    for cliente in grupo.clientes.filter(ativo=True):
-                        if cliente not in clientes:
-                            clientes.append(cliente)
-            
-            # Criar objetos de email
-            emails_criados = []
-            for cliente in clientes:
-                email, created = Email.objects.get_or_create(
-                    campanha=campanha,
-                    cliente=cliente,
-                    defaults={'status': 'aguardando'}
-                )
-                if created:
-                    emails_criados.append(email)
+            # Criar relatório e os objetos de email do público
+            preparar_campanha(campanha)
             
             # Iniciar processo de envio
             processar_envio_campanha(campanha)
@@ -117,31 +111,68 @@ def processar_campanhas_agendadas():
             campanha.status = 'falha'
             campanha.save()
 
-def processar_envio_campanha(campanha):
-    """Processa o envio de todos os emails de uma campanha"""
+def processar_envio_campanha(campanha, deve_parar=None):
+    """
+    Processa o envio de todos os emails de uma campanha, reservando-os em lotes.
+    Se `deve_parar()` retornar True, nenhum novo lote é reservado e os já reservados são concluídos.
+    """
     try:
-        # Buscar emails pendentes
-        emails_pendentes = Email.objects.filter(
-            campanha=campanha,
-            status='aguardando'
-        )
+        inicio = time.monotonic()
+        worker = identificador_worker()
+        gravador = GravadorResultados(worker)
         
-        total_enviados = 0
-        total_falhas = 0
+        totais = {'enviado': 0, 'falha': 0, 'aguardando': 0}
         
-        # Enviar emails
-        for email in emails_pendentes:
-            sucesso = enviar_email_para_cliente(email)
-            if sucesso:
-                total_enviados += 1
-            else:
-                total_falhas += 1
-            
-            # Pequeno delay para não sobrecarregar o servidor SMTP
-            time.sleep(0.1)
+        with metricas.medir('compilacao'):
+            compilada = CampanhaCompilada(campanha)
+        with metricas.medir('anexos'):
+            anexos = cache_anexos.partes_da_campanha(campanha)
+        
+        def mensagens():
+            # Cada lote é reservado só quando o despachante precisa de mais mensagens
+            while not (deve_parar and deve_parar()):
+                with metricas.medir('reserva'):
+                    lote = reservar_lote(campanha, worker)
+                if not lote:
+                    return
+                for email_obj in lote:
+                    email_obj.campanha = campanha
+                    # Domínios com o disjuntor aberto não recebem envios até o fim da pausa
+                    bloqueado_ate = disjuntor_dominios.bloqueado_ate(dominio_email(email_obj.cliente.email))
+                    if bloqueado_ate:
+                        gravador.adiar(email_obj, bloqueado_ate)
+                        totais['aguardando'] += 1
+                        continue
+                    try:
+                        with metricas.medir('renderizacao'):
+                            mensagem = montar_email(email_obj, compilada, anexos)
+                        yield email_obj, mensagem
+                    except Exception as e:
+                        # Falha ao montar a mensagem (ex.: anexo ausente) não interrompe a campanha;
+                        # registrada já aqui, para não se perder se o envio for interrompido depois
+                        totais[gravador.registrar(email_obj, e)] += 1
+        
+        # Enviar emails em paralelo, intercalando os domínios e respeitando os limites de taxa
+        despachante = criar_despachante()
+        try:
+            for email_obj, erro in despachante.enviar(mensagens()):
+                if not isinstance(erro, EnvioAdiado):
+                    disjuntor_dominios.registrar(dominio_email(email_obj.cliente.email), erro)
+                totais[gravador.registrar(email_obj, erro)] += 1
+        finally:
+            # Gravar os resultados já confirmados mesmo se o envio for interrompido
+            gravador.descarregar()
+            duracao = time.monotonic() - inicio
+            for status_email, quantidade in totais.items():
+                metricas.incrementar('marketing_emails_total', quantidade, status=status_email)
+            # Uma série por campanha cresce sem limite no Prometheus; só com opt-in explícito
+            if getattr(settings, 'MARKETING_METRICAS_POR_CAMPANHA', False):
+                for status_email, quantidade in totais.items():
+                    metricas.incrementar('marketing_campanha_emails_total', quantidade, campanha=campanha.id, status=status_email)
+                metricas.definir('marketing_campanha_msgs_por_segundo', totais['enviado'] / duracao if duracao else 0.0, campanha=campanha.id)
         
-        # Atualizar status da campanha
-        if total_falhas == 0 and Email.objects.filter(campanha=campanha, status='aguardando').count() == 0:
+        # A campanha termina quando nenhum email aguarda envio ou retentativa, mesmo com falhas definitivas
+        if not possui_pendentes(campanha):
             campanha.status = 'concluida'
             campanha.data_fim_envio = timezone.now()
             campanha.save()
@@ -151,8 +182,9 @@ def processar_envio_campanha(campanha):
             campanha.relatorio.atualizar_metricas()
         
         return {
-            'enviados': total_enviados,
-            'falhas': total_falhas
+            'enviados': totais['enviado'],
+            'falhas': totais['falha'],
+            'reagendados': totais['aguardando']
         }
     except Exception as e:
         logger.error(f"Erro no processamento da campanha {campanha.id}: {str(e)}")
@@ -5,11 +5,19 @@ from . import views
 router = DefaultRouter()
 router.register(r'clientes', views.ClienteViewSet)
 router.register(r'grupos', views.GrupoClienteViewSet)
+router.register(r'segmentos', views.SegmentoViewSet)
 router.register(r'campanhas', views.CampanhaViewSet)
 router.register(r'anexos', views.AnexoViewSet)
 router.register(r'emails', views.EmailViewSet)
 router.register(r'relatorios', views.RelatorioViewSet)
+router.register(r'importacoes', views.ImportacaoViewSet)
+router.register(r'disparos', views.DisparoViewSet)
 
 urlpatterns = [
+    # Rastreamento pelo uuid do email; ids numéricos seguem para o EmailViewSet
+    path('emails/<uuid:uuid>/rastreamento/', views.pixel_rastreamento, name='pixel_rastreamento'),
+    path('emails/<uuid:uuid>/clique/', views.clique_rastreamento, name='clique_rastreamento'),
+    path('l/<str:token>/', views.redirecionar_clique, name='redirecionar_clique'),
+    path('metricas/', views.metricas_prometheus, name='metricas'),
     path('', include(router.urls)),
 ] 
\ No newline at end of file
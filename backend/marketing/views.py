@@ -2,26 +2,160 @@ from django.shortcuts import render
 from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.exceptions import ValidationError
 from rest_framework.parsers import MultiPartParser, FormParser
 from django.core.mail import EmailMessage, EmailMultiAlternatives
 from django.utils import timezone
+from django.utils.crypto import constant_time_compare
 from django.template import Template, Context
-from django.http import HttpResponse
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden, HttpResponseRedirect, Http404, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
 from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError as ErroValidacao
+from django.db import transaction
+from django.db.models import Count, Prefetch, Q
+from django.utils.dateparse import parse_date, parse_datetime
 
-from .models import Cliente, GrupoCliente, Campanha, Anexo, Email, Relatorio
+from .models import Cliente, GrupoCliente, Segmento, Campanha, Anexo, Email, Relatorio, Importacao, Disparo
+from .anexos import cache_anexos
+from .exportacao import compactar_gzip, linhas_csv_emails
+from .importacao import importar_clientes_csv
+from .links import cache_links, verificar_token
+from .metricas import metricas
+from .paginacao import PaginacaoCursor
+from .publico import resolver_publico
+from .rastreamento import buffer_rastreamento, identificador_email, registrar_evento
+from .segmentos import clientes_do_segmento, contar_segmento
 from .serializers import (
-    UserSerializer, ClienteSerializer, GrupoClienteSerializer,
+    UserSerializer, ClienteSerializer, GrupoClienteSerializer, SegmentoSerializer,
     CampanhaSerializer, CampanhaDetailSerializer, AnexoSerializer, 
-    EmailSerializer, RelatorioSerializer
+    EmailSerializer, RelatorioSerializer, ImportacaoSerializer, DisparoSerializer
 )
 
+from datetime import datetime, time
 import csv
-import io
+
+# Imagem transparente de 1x1 pixel usada no rastreamento de aberturas
+PIXEL_GIF = b'\x47\x49\x46\x38\x39\x61\x01\x00\x01\x00\x80\x00\x00\xff\xff\xff\x00\x00\x00\x21\xf9\x04\x01\x00\x00\x00\x00\x2c\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02\x02\x44\x01\x00\x3b'
+
+def resposta_pixel():
+    response = HttpResponse(PIXEL_GIF, content_type='image/gif')
+    # Impedir cache para que cada abertura chegue ao servidor
+    response['Cache-Control'] = 'no-store, no-cache, must-revalidate, max-age=0'
+    response['Pragma'] = 'no-cache'
+    response['Expires'] = '0'
+    response['Content-Length'] = len(PIXEL_GIF)
+    return response
+
+@require_GET
+def pixel_rastreamento(request, uuid):
+    """Rastreamento de aberturas pelo uuid do email, sem a pilha do DRF"""
+    registrar_evento('aberto', uuid)
+    return resposta_pixel()
+
+@require_GET
+def clique_rastreamento(request, uuid):
+    """Rastreamento de cliques pelo uuid do email, sem a pilha do DRF; os links enviados usam redirecionar_clique"""
+    registrar_evento('clicado', uuid)
+    return JsonResponse({'status': 'Clique registrado'})
+
+@require_GET
+def redirecionar_clique(request, token):
+    """
+    Redireciona o clique para o link original da campanha. A assinatura do token é validada
+    sem consultar o banco, a URL vem do cache de links e o clique entra no buffer de rastreamento.
+    """
+    dados = verificar_token(token)
+    if dados is None:
+        raise Http404
+    campanha_id, email_id, link_id = dados
+    url = cache_links.url(campanha_id, link_id)
+    if url is None:
+        raise Http404
+    registrar_evento('clicado', email_id)
+
+    response = HttpResponseRedirect(url)
+    # Impedir cache para que cada clique chegue ao servidor
+    response['Cache-Control'] = 'no-store, no-cache, must-revalidate, max-age=0'
+    return response
+
+@require_GET
+def metricas_prometheus(request):
+    """Métricas do processo e profundidade da fila no formato de texto do Prometheus"""
+    if not metricas.ativo:
+        raise Http404
+    token = getattr(settings, 'MARKETING_METRICAS_TOKEN', '')
+    if token:
+        autorizado = constant_time_compare(request.META.get('HTTP_AUTHORIZATION', ''), f'Bearer {token}')
+    else:
+        # Sem token, só coletas diretas: atrás de um proxy reverso o REMOTE_ADDR é o endereço do proxy
+        autorizado = request.META.get('REMOTE_ADDR') in getattr(settings, 'MARKETING_METRICAS_IPS', ())
+    if not autorizado:
+        return HttpResponseForbidden()
+
+    # Profundidade da fila medida na hora da coleta, para valer também com o envio em outros processos
+    gauges = {('marketing_fila_emails', (('status', status_email),)): 0 for status_email in ('aguardando', 'enviando')}
+    for status_email, quantidade in (
+        Email.objects.filter(status__in=['aguardando', 'enviando']).values_list('status').annotate(Count('id')).order_by()
+    ):
+        gauges[('marketing_fila_emails', (('status', status_email),))] = quantidade
+    gauges[('marketing_fila_disparos', ())] = Disparo.objects.filter(status__in=['pendente', 'processando']).count()
+    gauges[('marketing_rastreamento_buffer', ())] = len(buffer_rastreamento)
+
+    return HttpResponse(metricas.formato_prometheus(gauges), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+def filtrar_periodo(queryset, params, *campos):
+    """Aplica os filtros <campo>_de e <campo>_ate (data ou data/hora ISO 8601) aos campos informados"""
+    for campo in campos:
+        for sufixo, lookup in (('_de', 'gte'), ('_ate', 'lte')):
+            valor = params.get(campo + sufixo)
+            if not valor:
+                continue
+            try:
+                dia = parse_date(valor)
+                data = parse_datetime(valor) if dia is None else None
+            except ValueError:
+                dia = data = None
+            if dia is not None:
+                # Datas sem horário cobrem o dia inteiro
+                data = datetime.combine(dia, time.max if lookup == 'lte' else time.min)
+            if data is None:
+                raise ValidationError({campo + sufixo: 'Data inválida'})
+            if timezone.is_naive(data):
+                data = timezone.make_aware(data)
+            queryset = queryset.filter(**{f'{campo}__{lookup}': data})
+    return queryset
 
 class ClienteViewSet(viewsets.ModelViewSet):
     queryset = Cliente.objects.all()
     serializer_class = ClienteSerializer
+    pagination_class = PaginacaoCursor
+    
+    def get_queryset(self):
+        queryset = Cliente.objects.all()
+        params = self.request.query_params
+        
+        ativo = params.get('ativo')
+        if ativo is not None:
+            queryset = queryset.filter(ativo=ativo.lower() in ('1', 'true'))
+        
+        grupo_id = params.get('grupo')
+        if grupo_id:
+            queryset = queryset.filter(grupos__id=grupo_id)
+        
+        busca = params.get('busca')
+        if busca:
+            queryset = queryset.filter(
+                Q(nome__icontains=busca) | Q(sobrenome__icontains=busca) | Q(email__icontains=busca)
+            )
+        
+        return filtrar_periodo(queryset, params, 'data_cadastro')
+    
+    @action(detail=False, methods=['get'])
+    def total(self, request):
+        # Contagem dos clientes (com os mesmos filtros da listagem), já que a paginação por cursor não a informa
+        return Response({'total': self.get_queryset().count()})
     
     @action(detail=False, methods=['post'])
     def importar_csv(self, request):
@@ -30,43 +164,41 @@ class ClienteViewSet(viewsets.ModelViewSet):
             if not csv_file:
                 return Response({'erro': 'Nenhum arquivo enviado'}, status=status.HTTP_400_BAD_REQUEST)
             
-            decoded_file = csv_file.read().decode('utf-8')
-            io_string = io.StringIO(decoded_file)
-            reader = csv.reader(io_string)
-            next(reader)  # Pular cabeçalho
-            
-            clientes_criados = 0
-            clientes_atualizados = 0
-            erros = []
+            resultado = importar_clientes_csv(csv_file)
             
-            for row in reader:
-                if len(row) >= 3:  # Verificar se a linha tem os campos necessários
-                    nome, sobrenome, email = row[0], row[1], row[2]
-                    
-                    try:
-                        cliente, created = Cliente.objects.update_or_create(
-                            email=email,
-                            defaults={'nome': nome, 'sobrenome': sobrenome}
-                        )
-                        if created:
-                            clientes_criados += 1
-                        else:
-                            clientes_atualizados += 1
-                    except Exception as e:
-                        erros.append(f"Erro ao processar linha {nome}, {sobrenome}, {email}: {str(e)}")
-                else:
-                    erros.append(f"Linha com formato inválido: {','.join(row)}")
-            
-            return Response({
-                'clientes_criados': clientes_criados,
-                'clientes_atualizados': clientes_atualizados,
-                'erros': erros
-            })
+            return Response(resultado)
         except Exception as e:
             return Response({'erro': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    @action(detail=False, methods=['post'])
+    def importar_csv_async(self, request):
+        # Armazena o arquivo e deixa o processamento para o comando processar_importacoes
+        csv_file = request.FILES.get('arquivo')
+        if not csv_file:
+            return Response({'erro': 'Nenhum arquivo enviado'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        importacao = Importacao.objects.create(arquivo=csv_file)
+        serializer = ImportacaoSerializer(importacao, context={'request': request})
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+
+class ImportacaoViewSet(viewsets.ReadOnlyModelViewSet):
+    # Consulta do progresso das importações assíncronas
+    queryset = Importacao.objects.all().order_by('-data_criacao')
+    serializer_class = ImportacaoSerializer
+
+class DisparoViewSet(viewsets.ReadOnlyModelViewSet):
+    # Consulta do progresso dos disparos de campanhas iniciadas pela API
+    queryset = Disparo.objects.all().order_by('-data_criacao')
+    serializer_class = DisparoSerializer
+
+def grupos_com_contagem():
+    """Grupos com a contagem de clientes anotada e os ids dos clientes pré-carregados"""
+    return GrupoCliente.objects.annotate(clientes_count=Count('clientes', distinct=True)).prefetch_related(
+        Prefetch('clientes', queryset=Cliente.objects.only('id'))
+    )
 
 class GrupoClienteViewSet(viewsets.ModelViewSet):
-    queryset = GrupoCliente.objects.all()
+    queryset = grupos_com_contagem()
     serializer_class = GrupoClienteSerializer
     
     @action(detail=True, methods=['post'])
@@ -89,8 +221,34 @@ class GrupoClienteViewSet(viewsets.ModelViewSet):
         
         return Response({'status': 'Clientes removidos do grupo'})
 
+class SegmentoViewSet(viewsets.ModelViewSet):
+    queryset = Segmento.objects.all()
+    serializer_class = SegmentoSerializer
+
+    @action(detail=True, methods=['get'])
+    def previa(self, request, pk=None):
+        # Tamanho do segmento, vindo do cache enquanto nenhum cliente ou grupo mudar
+        total, cache = contar_segmento(self.get_object())
+        return Response({'total': total, 'cache': cache})
+
+    @action(detail=False, methods=['post'], url_path='previa')
+    def previa_regras(self, request):
+        # Prévia de regras ainda não salvas, para o editor de segmentos
+        try:
+            total = clientes_do_segmento(request.data.get('regras', {})).count()
+        except ErroValidacao as e:
+            return Response({'erro': e.messages}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'total': total, 'cache': False})
+
 class CampanhaViewSet(viewsets.ModelViewSet):
-    queryset = Campanha.objects.all()
+    queryset = Campanha.objects.select_related('criador', 'relatorio').prefetch_related('anexos')
+    
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'retrieve':
+            # O detalhe serializa os grupos completos, com a contagem de clientes
+            return queryset.prefetch_related(Prefetch('grupos', queryset=grupos_com_contagem()), 'segmentos')
+        return queryset.prefetch_related('grupos', 'segmentos')
     
     def get_serializer_class(self):
         if self.action == 'retrieve':
@@ -136,9 +294,8 @@ class CampanhaViewSet(viewsets.ModelViewSet):
             )
             
             # Adicionar anexos
-            anexos = campanha.anexos.all()
-            for anexo in anexos:
-                email.attach_file(anexo.arquivo.path)
+            for parte in cache_anexos.partes_da_campanha(campanha):
+                email.attach(parte)
             
             # Enviar email
             email.send()
@@ -149,37 +306,28 @@ class CampanhaViewSet(viewsets.ModelViewSet):
     
     @action(detail=True, methods=['post'])
     def iniciar_envio(self, request, pk=None):
-        campanha = self.get_object()
-        
-        if campanha.status not in ['rascunho', 'agendada']:
-            return Response({'erro': 'Campanha não pode ser iniciada'}, status=status.HTTP_400_BAD_REQUEST)
-        
-        campanha.status = 'enviando'
-        campanha.data_inicio_envio = timezone.now()
-        campanha.save()
-        
-        # Em um cenário real, aqui você iniciaria um processo em background para enviar os emails
-        # Como exemplo, vamos criar registros de Email para cada cliente
-        clientes = []
-        
-        if campanha.todos_clientes:
-            clientes = Cliente.objects.filter(ativo=True)
-        else:
-            for grupo in campanha.grupos.all():
-                clientes.extend(grupo.clientes.filter(ativo=True))
-        
-        # Criar registros de Email
-        for cliente in clientes:
-            Email.objects.create(
-                campanha=campanha,
-                cliente=cliente,
-                status='aguardando'
+        # A transição condicional impede que duas requisições iniciem a mesma campanha
+        with transaction.atomic():
+            iniciada = Campanha.objects.filter(pk=pk, status__in=['rascunho', 'agendada']).update(
+                status='enviando',
+                data_inicio_envio=timezone.now()
             )
+            if iniciada:
+                # Os emails do público são criados em lotes pelo processo de envio em segundo plano
+                disparo = Disparo.objects.create(campanha_id=Campanha._meta.pk.to_python(pk))
         
-        # Criar relatório se não existir
-        Relatorio.objects.get_or_create(campanha=campanha)
+        if not iniciada:
+            self.get_object()  # 404 se a campanha não existir
+            return Response({'erro': 'Campanha não pode ser iniciada'}, status=status.HTTP_400_BAD_REQUEST)
         
-        return Response({'status': 'Envio de campanha iniciado com sucesso'})
+        serializer = DisparoSerializer(disparo, context={'request': request})
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+    
+    @action(detail=True, methods=['get'])
+    def previa_publico(self, request, pk=None):
+        # Destinatários únicos de grupos e segmentos, contados na mesma consulta usada pelo disparo
+        campanha = self.get_object()
+        return Response({'total': resolver_publico(campanha).count()})
     
     @action(detail=True, methods=['get'])
     def exportar_relatorio(self, request, pk=None):
@@ -187,7 +335,7 @@ class CampanhaViewSet(viewsets.ModelViewSet):
         
         try:
             # Verificar se existe relatório
-            relatorio, created = Relatorio.objects.get_or_create(campanha=campanha)
+            relatorio = Relatorio.obter_para(campanha)
             
             # Atualizar métricas
             relatorio.atualizar_metricas()
@@ -216,6 +364,31 @@ class CampanhaViewSet(viewsets.ModelViewSet):
         except Exception as e:
             return Response({'erro': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    @action(detail=True, methods=['get'])
+    def exportar_emails(self, request, pk=None):
+        # Exporta os dados de cada destinatário em streaming; ?gzip=1 comprime a saída
+        campanha = self.get_object()
+        compactar = request.query_params.get('gzip') in ('1', 'true')
+        
+        emails = (
+            Email.objects.filter(campanha=campanha)
+            .select_related('cliente')
+            .only('id', 'status', 'data_envio', 'data_abertura', 'data_clique', 'data_resposta',
+                  'cliente__nome', 'cliente__sobrenome', 'cliente__email')
+            .order_by('id')
+            .iterator(chunk_size=getattr(settings, 'MARKETING_TAMANHO_LOTE', 1000))
+        )
+        
+        conteudo = linhas_csv_emails(emails)
+        if compactar:
+            conteudo = compactar_gzip(conteudo)
+            response = StreamingHttpResponse(conteudo, content_type='application/gzip')
+            response['Content-Disposition'] = f'attachment; filename="emails_campanha_{campanha.id}.csv.gz"'
+        else:
+            response = StreamingHttpResponse(conteudo, content_type='text/csv')
+            response['Content-Disposition'] = f'attachment; filename="emails_campanha_{campanha.id}.csv"'
+        return response
+
 class AnexoViewSet(viewsets.ModelViewSet):
     queryset = Anexo.objects.all()
     serializer_class = AnexoSerializer
@@ -232,42 +405,52 @@ class AnexoViewSet(viewsets.ModelViewSet):
         )
 
 class EmailViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Email.objects.all()
+    queryset = Email.objects.select_related('cliente')
     serializer_class = EmailSerializer
+    pagination_class = PaginacaoCursor
     
     def get_queryset(self):
-        queryset = Email.objects.all()
-        campanha_id = self.request.query_params.get('campanha')
+        queryset = Email.objects.select_related('cliente')
+        params = self.request.query_params
+        
+        campanha_id = params.get('campanha')
         if campanha_id:
             queryset = queryset.filter(campanha_id=campanha_id)
-        return queryset
+        
+        status_email = params.get('status')
+        if status_email:
+            queryset = queryset.filter(status__in=status_email.split(','))
+        
+        return filtrar_periodo(queryset, params, 'data_envio', 'data_abertura', 'data_clique', 'data_resposta')
     
     @action(detail=True, methods=['get'])
     def rastreamento(self, request, pk=None):
-        # Endpoint para rastrear aberturas de email
-        email = self.get_object()
-        email.marcar_como_aberto()
+        # Endpoint para rastrear aberturas de email; a gravação é feita em lote depois da resposta
+        identificador = identificador_email(pk)
+        if identificador is None:
+            raise Http404
+        registrar_evento('aberto', identificador)
         
         # Retorna uma imagem transparente de 1x1 pixel
-        pixel_gif = b'\x47\x49\x46\x38\x39\x61\x01\x00\x01\x00\x80\x00\x00\xff\xff\xff\x00\x00\x00\x21\xf9\x04\x01\x00\x00\x00\x00\x2c\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02\x02\x44\x01\x00\x3b'
-        return HttpResponse(pixel_gif, content_type='image/gif')
+        return resposta_pixel()
     
     @action(detail=True, methods=['get'])
     def clique(self, request, pk=None):
         # Endpoint para rastrear cliques em links
-        email = self.get_object()
-        email.marcar_como_clicado()
+        identificador = identificador_email(pk)
+        if identificador is None:
+            raise Http404
+        registrar_evento('clicado', identificador)
         
-        # Redirecionar para a URL original
-        url_original = request.query_params.get('url', '/')
-        return Response({'status': 'Clique registrado', 'redirect_url': url_original})
+        # O parâmetro url não é confiável; os links enviados redirecionam por redirecionar_clique
+        return Response({'status': 'Clique registrado'})
 
 class RelatorioViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Relatorio.objects.all()
+    queryset = Relatorio.objects.select_related('campanha')
     serializer_class = RelatorioSerializer
     
     @action(detail=True, methods=['post'])
     def atualizar(self, request, pk=None):
         relatorio = self.get_object()
-        relatorio.atualizar_metricas()
+        relatorio.recontar_metricas()
         return Response({'status': 'Relatório atualizado com sucesso'})
@@ -67,7 +67,8 @@ const DetalheCampanha = () => {
             'agendada': <Badge bg="primary">Agendada</Badge>,
             'enviando': <Badge bg="warning">Enviando</Badge>,
             'concluida': <Badge bg="success">Concluída</Badge>,
-            'cancelada': <Badge bg="danger">Cancelada</Badge>
+            'cancelada': <Badge bg="danger">Cancelada</Badge>,
+            'falha': <Badge bg="danger">Falha</Badge>
         };
 
         return statusMap[status] || <Badge bg="secondary">Desconhecido</Badge>;
@@ -13,7 +13,7 @@ const Home = () => {
     useEffect(() => {
         const carregarDados = async () => {
             try {
-                const resClientes = await clienteService.listarTodos();
+                const resClientes = await clienteService.total();
                 const resCampanhas = await campanhaService.listarTodas();
 
                 const campanhasAtivas = resCampanhas.data.filter(
@@ -25,7 +25,7 @@ const Home = () => {
                 ).length;
 
                 setResumo({
-                    totalClientes: resClientes.data.length,
+                    totalClientes: resClientes.data.total,
                     campanhasAtivas,
                     campanhasConcluidas
                 });
@@ -5,27 +5,55 @@ import { clienteService } from '../services/api';
 
 const ListaClientes = () => {
     const [clientes, setClientes] = useState([]);
+    const [proximaPagina, setProximaPagina] = useState(null);
+    const [totalClientes, setTotalClientes] = useState(0);
     const [filtro, setFiltro] = useState('');
     const [carregando, setCarregando] = useState(true);
     const [erro, setErro] = useState(null);
 
     useEffect(() => {
-        carregarClientes();
-    }, []);
+        // A busca é feita no servidor; aguardar uma pausa na digitação antes de consultar
+        let cancelado = false;
+        const temporizador = setTimeout(() => carregarClientes(filtro, () => cancelado), filtro ? 300 : 0);
+        return () => {
+            cancelado = true;
+            clearTimeout(temporizador);
+        };
+    }, [filtro]);
 
-    const carregarClientes = async () => {
+    const carregarClientes = async (busca = filtro, cancelado = () => false) => {
         setCarregando(true);
         try {
-            const response = await clienteService.listarTodos();
-            setClientes(response.data);
+            const params = busca ? { busca } : {};
+            const [response, resTotal] = await Promise.all([
+                clienteService.listarTodos(params),
+                clienteService.total(params)
+            ]);
+            // Ignorar respostas de uma busca que já foi substituída por outra
+            if (cancelado()) return;
+            setClientes(response.data.results);
+            setProximaPagina(response.data.next);
+            setTotalClientes(resTotal.data.total);
             setCarregando(false);
         } catch (error) {
+            if (cancelado()) return;
             setErro('Erro ao carregar a lista de clientes. Tente novamente mais tarde.');
             setCarregando(false);
             console.error('Erro ao carregar clientes:', error);
         }
     };
 
+    const carregarMais = async () => {
+        try {
+            const response = await clienteService.proximaPagina(proximaPagina);
+            setClientes([...clientes, ...response.data.results]);
+            setProximaPagina(response.data.next);
+        } catch (error) {
+            setErro('Erro ao carregar mais clientes. Tente novamente mais tarde.');
+            console.error('Erro ao carregar clientes:', error);
+        }
+    };
+
     const excluirCliente = async (id) => {
         if (window.confirm('Tem certeza que deseja excluir este cliente?')) {
             try {
@@ -38,18 +66,6 @@ const ListaClientes = () => {
         }
     };
 
-    const filtrarClientes = () => {
-        if (!filtro) return clientes;
-
-        return clientes.filter(cliente =>
-            cliente.nome.toLowerCase().includes(filtro.toLowerCase()) ||
-            cliente.sobrenome.toLowerCase().includes(filtro.toLowerCase()) ||
-            cliente.email.toLowerCase().includes(filtro.toLowerCase())
-        );
-    };
-
-    const clientesFiltrados = filtrarClientes();
-
     return (
         <div>
             <div className="d-flex justify-content-between align-items-center mb-4">
@@ -90,9 +106,9 @@ const ListaClientes = () => {
                 <p className="text-center">Carregando clientes...</p>
             ) : (
                 <>
-                    <p>Total de clientes: {clientesFiltrados.length}</p>
+                    <p>Total de clientes: {totalClientes}</p>
 
-                    {clientesFiltrados.length === 0 ? (
+                    {clientes.length === 0 ? (
                         <Alert variant="info">
                             Nenhum cliente encontrado. {filtro ? 'Tente um filtro diferente ou ' : ''}
                             <Link to="/clientes/novo">cadastre um novo cliente</Link>.
@@ -109,7 +125,7 @@ const ListaClientes = () => {
                                 </tr>
                             </thead>
                             <tbody>
-                                {clientesFiltrados.map(cliente => (
+                                {clientes.map(cliente => (
                                     <tr key={cliente.id}>
                                         <td>{cliente.nome}</td>
                                         <td>{cliente.sobrenome}</td>
@@ -136,6 +152,14 @@ const ListaClientes = () => {
                             </tbody>
                         </Table>
                     )}
+
+                    {proximaPagina && (
+                        <div className="text-center mb-4">
+                            <Button variant="outline-primary" onClick={carregarMais}>
+                                Carregar mais
+                            </Button>
+                        </div>
+                    )}
                 </>
             )}
         </div>
@@ -33,9 +33,9 @@ const NovaCampanha = () => {
                 setGrupos(resGrupos.data);
 
                 // Carregar um cliente aleatório para preview
-                const resClientes = await clienteService.listarTodos();
-                if (resClientes.data.length > 0) {
-                    setClienteExemplo(resClientes.data[0]);
+                const resClientes = await clienteService.listarTodos({ page_size: 1 });
+                if (resClientes.data.results.length > 0) {
+                    setClienteExemplo(resClientes.data.results[0]);
                 }
             } catch (error) {
                 setErro('Erro ao carregar dados. Tente novamente mais tarde.');
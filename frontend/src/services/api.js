@@ -24,7 +24,10 @@ api.interceptors.request.use(
 
 // Serviços de clientes
 const clienteService = {
-    listarTodos: () => api.get('/clientes/'),
+    // A listagem é paginada por cursor: a resposta traz `results` e o link `next` da próxima página
+    listarTodos: (params) => api.get('/clientes/', { params }),
+    proximaPagina: (url) => api.get(url),
+    total: (params) => api.get('/clientes/total/', { params }),
     obterPorId: (id) => api.get(`/clientes/${id}/`),
     criar: (dados) => api.post('/clientes/', dados),
     atualizar: (id, dados) => api.put(`/clientes/${id}/`, dados),